@@ -9,6 +9,7 @@ Final Invoice Processor - Complete Flow
 
 import imaplib
 import email
+import functools
 import re
 import os
 from datetime import datetime, timedelta
@@ -18,7 +19,7 @@ from fuzzywuzzy import fuzz, process
 from dotenv import load_dotenv
 import PyPDF2
 from google_drive_uploader import GoogleDriveUploader
-from openai_vision_extractor import OpenAIPropertyExtractor
+from openai_vision_extractor import OpenAIPropertyExtractor, parse_invoice_fields, NON_INVOICE_PDF
 import io
 
 try:
@@ -55,11 +56,13 @@ INVOICE_KEYWORDS = [
     'hotel', 'accommodation', 'travel', 'booking id', 'reservation id',
     'pending', 'required', 'urgent', 'bills'
 ]
+# All keywords in one alternation - a single scan of the email text instead of one per keyword
+INVOICE_KEYWORDS_PATTERN = re.compile('|'.join(re.escape(keyword) for keyword in INVOICE_KEYWORDS))
 
 def load_vendor_reference():
     """Load the Excel reference sheet with vendor names"""
     try:
-        df = pd.read_excel('userlist.xlsx')
+        df = pd.read_excel('userlist.xlsx', engine='calamine')
         vendor_reference = {}
         columns = ['SANDHYA', 'MOKSHITHA', 'KUMAR', 'LAKSHMI']
         
@@ -80,7 +83,26 @@ def load_vendor_reference():
 def is_invoice_email(subject, body):
     """Check if email is an invoice based on subject and body"""
     text = f"{subject} {body}".lower()
-    return any(keyword in text for keyword in INVOICE_KEYWORDS)
+    return INVOICE_KEYWORDS_PATTERN.search(text) is not None
+
+# Emails fetched per IMAP FETCH command - one round-trip per batch instead of one per email
+IMAP_FETCH_BATCH_SIZE = 25
+
+def iter_fetched_emails(mail, email_ids, batch_size=IMAP_FETCH_BATCH_SIZE):
+    """Yield (email_id, raw RFC822 bytes) for each email id, fetching batch_size emails per request
+    raw bytes are None when the batch fetch did not return that email (the caller fetches it alone)"""
+    for start in range(0, len(email_ids), batch_size):
+        batch_ids = email_ids[start:start + batch_size]
+        fetched = {}
+        try:
+            status, msg_data = mail.fetch(b','.join(batch_ids), '(RFC822)')
+            for item in msg_data:
+                if isinstance(item, tuple):
+                    fetched[item[0].split()[0]] = item[1]
+        except Exception as e:
+            print(f"   ⚠️  Batch fetch failed ({e}) - fetching emails one by one")
+        for email_id in batch_ids:
+            yield email_id, fetched.get(email_id)
 
 def decode_email_subject(subject):
     """Decode email subject if it's encoded"""
@@ -103,10 +125,7 @@ def extract_text_from_pdf(pdf_data):
     """Extract text content from PDF data"""
     try:
         pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        return "".join(page.extract_text() + "\n" for page in pdf_reader.pages)
     except Exception as e:
         print(f"   ⚠️  Error extracting PDF text: {e}")
         return ""
@@ -135,6 +154,8 @@ def extract_attachment_info(email_message):
                 if content_type == 'application/pdf' and payload:
                     print(f"   📄 Processing PDF: {filename}")
                     pdf_text = extract_text_from_pdf(payload)
+                    # Keep the full text so AWS Bedrock extraction does not re-parse the PDF
+                    attachment_info['pdf_text'] = pdf_text
                     if pdf_text:
                         attachment_info['extracted_text'] = pdf_text[:1000] + "..." if len(pdf_text) > 1000 else pdf_text
                         attachment_texts.append(pdf_text)
@@ -145,7 +166,7 @@ def extract_attachment_info(email_message):
     # Return empty list if no attachments, not ['None']
     return attachments if attachments else [], attachment_texts
 
-def extract_vendor_name_improved(subject, from_email, body, pdf_analysis=None, pdf_data=None, openai_extractor=None):
+def extract_vendor_name_improved(subject, from_email, body, pdf_analysis=None, pdf_data=None, openai_extractor=None, pdf_text=None):
     """Extract vendor name with improved logic"""
     # First, try to get hotel name from PDF analysis if available
     hotel_name = None
@@ -159,7 +180,7 @@ def extract_vendor_name_improved(subject, from_email, body, pdf_analysis=None, p
     # If no hotel name from PDF, try AWS Bedrock
     if not hotel_name and pdf_data and openai_extractor and openai_extractor.enabled:
         try:
-            hotel_name = openai_extractor.extract_property_name_from_pdf(pdf_data)
+            hotel_name = openai_extractor.extract_property_name_from_pdf(pdf_data, pdf_text=pdf_text)
             if hotel_name and hotel_name != 'Not Found':
                 print(f"   🤖 AWS Bedrock extracted hotel: {hotel_name}")
         except Exception as e:
@@ -625,22 +646,36 @@ def extract_comprehensive_email_data(email_message, subject, from_email, body, o
         if not valid_attachments:
             print(f"   ⚠️  No valid attachments found (all are non-dictionary types)")
         else:
+            # Send every PDF of this email to AWS Bedrock in a single batched request
+            pdf_indices = [
+                i for i, attachment in enumerate(valid_attachments)
+                if attachment.get('content_type') == 'application/pdf' and attachment.get('payload')
+            ]
+            bedrock_results = {}
+            if pdf_indices and openai_extractor and openai_extractor.enabled:
+                try:
+                    batch_results = openai_extractor.extract_comprehensive_invoice_data_from_pdfs(
+                        [valid_attachments[i]['payload'] for i in pdf_indices],
+                        pdf_texts=[valid_attachments[i].get('pdf_text') for i in pdf_indices],
+                        skip_non_invoice=True
+                    )
+                    bedrock_results = dict(zip(pdf_indices, batch_results))
+                except Exception as e:
+                    print(f"   ⚠️  AWS Bedrock error for PDF batch: {e}")
+
             for i, attachment in enumerate(valid_attachments):
                 if attachment.get('content_type') == 'application/pdf' and attachment.get('payload'):
                     print(f"   🔍 Analyzing PDF {i+1} with AWS Bedrock...")
-                    
-                    # Extract text for fallback
-                    pdf_text = extract_text_from_pdf(attachment['payload'])
-                    
-                    # Try AWS Bedrock first
-                    openai_data = None
-                    if openai_extractor and openai_extractor.enabled:
-                        try:
-                            openai_data = openai_extractor.extract_comprehensive_invoice_data_from_pdf(attachment['payload'])
-                            if openai_data:
-                                print(f"   ✅ AWS Bedrock extracted data for PDF {i+1}")
-                        except Exception as e:
-                            print(f"   ⚠️  AWS Bedrock error for PDF {i+1}: {e}")
+
+                    # Use the AWS Bedrock result from the batched request
+                    openai_data = bedrock_results.get(i)
+                    # PDFs without invoice text (terms, brochures) skip Bedrock but are still uploaded
+                    non_invoice_pdf = openai_data == NON_INVOICE_PDF
+                    if non_invoice_pdf:
+                        openai_data = None
+                        print(f"   📎 PDF {i+1} has no invoice fields - keeping it for upload without extracted data")
+                    elif openai_data:
+                        print(f"   ✅ AWS Bedrock extracted data for PDF {i+1}")
                     
                     # Create PDF data structure
                     pdf_data = {
@@ -666,58 +701,9 @@ def extract_comprehensive_email_data(email_message, subject, from_email, body, o
                     if openai_data:
                         pdf_data['bedrock_extracted_data'] = openai_data
                         # Parse AWS Bedrock response to extract structured data
-                        if 'HOTEL:' in openai_data:
-                            hotel_match = re.search(r'HOTEL:\s*([^\n]+)', openai_data)
-                            if hotel_match:
-                                pdf_data['hotel_name'] = hotel_match.group(1).strip()
-                        
-                        if 'GUEST:' in openai_data:
-                            guest_match = re.search(r'GUEST:\s*([^\n]+)', openai_data)
-                            if guest_match:
-                                pdf_data['guest_name'] = guest_match.group(1).strip()
-                        
                         # Note: Booking code is extracted from email, not PDF (see extract_booking_code_from_email)
-                        
-                        if 'BILL NO:' in openai_data:
-                            bill_match = re.search(r'BILL NO:\s*([^\n]+)', openai_data)
-                            if bill_match:
-                                pdf_data['bill_number'] = bill_match.group(1).strip()
-                        
-                        if 'AMOUNT:' in openai_data:
-                            amount_match = re.search(r'AMOUNT:\s*([^\n]+)', openai_data)
-                            if amount_match:
-                                pdf_data['total_amount'] = amount_match.group(1).strip()
-                        
-                        if 'ROOM:' in openai_data:
-                            room_match = re.search(r'ROOM:\s*([^\n]+)', openai_data)
-                            if room_match:
-                                pdf_data['room_number'] = room_match.group(1).strip()
-                        
-                        if 'GUESTS:' in openai_data:
-                            guests_match = re.search(r'GUESTS:\s*([^\n]+)', openai_data)
-                            if guests_match:
-                                pdf_data['number_of_pax'] = guests_match.group(1).strip()
-                        
-                        if 'CHECK-IN:' in openai_data:
-                            checkin_match = re.search(r'CHECK-IN:\s*([^\n]+)', openai_data)
-                            if checkin_match:
-                                pdf_data['arrival_date'] = checkin_match.group(1).strip()
-                        
-                        if 'CHECK-OUT:' in openai_data:
-                            checkout_match = re.search(r'CHECK-OUT:\s*([^\n]+)', openai_data)
-                            if checkout_match:
-                                pdf_data['departure_date'] = checkout_match.group(1).strip()
-                        
-                        if 'BILL DATE:' in openai_data:
-                            billdate_match = re.search(r'BILL DATE:\s*([^\n]+)', openai_data)
-                            if billdate_match:
-                                pdf_data['bill_date'] = billdate_match.group(1).strip()
-                        
-                        if 'GST:' in openai_data:
-                            gst_match = re.search(r'GST:\s*([^\n]+)', openai_data)
-                            if gst_match:
-                                pdf_data['gst_number'] = gst_match.group(1).strip()
-                    else:
+                        pdf_data.update(parse_invoice_fields(openai_data))
+                    elif not non_invoice_pdf:
                         print(f"   ❌ PDF couldn't be processed")
                         pdf_data['hotel_name'] = 'PDF couldn\'t be processed'
                     
@@ -1040,7 +1026,7 @@ def update_excel_sheet(invoice_data_list, drive_uploader):
         print("📊 Downloaded current Excel file")
         
         # Load existing data
-        df = pd.read_excel('temp_master.xlsx')
+        df = pd.read_excel('temp_master.xlsx', engine='calamine')
         print(f"📊 Current Excel has {len(df)} rows")
         
         # Prepare new data to append
@@ -1340,8 +1326,10 @@ def update_excel_sheet(invoice_data_list, drive_uploader):
         print(f"❌ Error updating Excel file: {e}")
         return None
 
-def process_invoices():
-    """Main function to process invoices from Gmail"""
+def process_invoices(bedrock_client=None, drive_uploader=None, progress_callback=None):
+    """Main function to process invoices from Gmail
+    bedrock_client / drive_uploader: already-initialized clients to reuse (e.g. across Streamlit runs)
+    progress_callback: called as progress_callback(emails_done, emails_total) while emails are processed"""
     print("📧 FINAL INVOICE PROCESSOR - COMPLETE FLOW")
     print("=" * 50)
     print("1. 📧 Check unread emails")
@@ -1351,18 +1339,22 @@ def process_invoices():
     print("=" * 50)
     
     # Initialize AWS Bedrock extractor
-    openai_extractor = OpenAIPropertyExtractor()
+    openai_extractor = OpenAIPropertyExtractor(client=bedrock_client)
     if openai_extractor.enabled:
         print(f"🤖 AWS Bedrock enabled for PDF analysis (Model: {openai_extractor.bedrock_model})")
     else:
         print("⚠️  AWS Bedrock disabled - using text analysis only")
     
-    # Initialize Google Drive uploader
-    drive_uploader = None
+    # Initialize Google Drive uploader (a reused uploader that already has its folders skips setup)
     if os.getenv('ENABLE_GOOGLE_DRIVE_UPLOAD', 'false').lower() == 'true':
         try:
-            drive_uploader = GoogleDriveUploader()
-            if drive_uploader.authenticate():
+            if drive_uploader is None:
+                drive_uploader = GoogleDriveUploader()
+            if drive_uploader.service and all(
+                folder in drive_uploader.folder_ids for folder in ['KUMAR', 'LAKSHMI', 'MOKSHITHA', 'SANDHYA', 'UNASSIGNED']
+            ):
+                print("✅ Google Drive initialized successfully (reusing folders)")
+            elif drive_uploader.authenticate():
                 drive_uploader.setup_folders()
                 print("✅ Google Drive initialized successfully")
             else:
@@ -1441,13 +1433,17 @@ def process_invoices():
     folder_counts = {'KUMAR': 0, 'LAKSHMI': 0, 'MOKSHITHA': 0, 'SANDHYA': 0, 'UNASSIGNED': 0}
     all_invoice_data = []  # Store all invoice data for Excel
     
-    for i, email_id in enumerate(recent_emails):
+    for i, (email_id, raw_email) in enumerate(iter_fetched_emails(mail, recent_emails)):
+        if progress_callback:
+            progress_callback(i, len(recent_emails))
         try:
             print(f"\n📨 Processing email {i+1}/{len(recent_emails)}")
             
-            # Fetch email
-            status, msg_data = mail.fetch(email_id, '(RFC822)')
-            email_message = email.message_from_bytes(msg_data[0][1])
+            # Fetch email (normally already fetched with its batch)
+            if raw_email is None:
+                status, msg_data = mail.fetch(email_id, '(RFC822)')
+                raw_email = msg_data[0][1]
+            email_message = email.message_from_bytes(raw_email)
             
             # Extract basic email info
             subject = decode_email_subject(email_message.get('Subject', ''))
@@ -1503,6 +1499,7 @@ def process_invoices():
                 # Extract vendor name using email table data or improved method
                 email_property_name = comprehensive_data.get('email_property_name')
                 pdf_data_for_vision = None
+                pdf_text_for_vision = None
                 attachments_list = comprehensive_data.get('attachments', [])
                 if attachments_list and len(attachments_list) > 0:
                     # Filter to only dictionary attachments
@@ -1510,6 +1507,7 @@ def process_invoices():
                     for attachment in valid_attachments:
                         if attachment.get('content_type') == 'application/pdf' and attachment.get('payload'):
                             pdf_data_for_vision = attachment['payload']
+                            pdf_text_for_vision = attachment.get('pdf_text')
                             break
                 
                 vendor_name = None
@@ -1523,7 +1521,8 @@ def process_invoices():
                         subject, from_email, body, 
                         pdf_analysis_data, 
                         pdf_data_for_vision, 
-                        openai_extractor
+                        openai_extractor,
+                        pdf_text=pdf_text_for_vision
                     )
                 
                 # Find the correct column for this vendor
@@ -1578,6 +1577,12 @@ def process_invoices():
                     
                     if pdf_count > 0:
                         print(f"   ✅ Processed {pdf_count} PDF(s) for: {assigned_column} folder")
+                    
+                    # PDF bytes are only needed for the upload above - release them so a long run
+                    # does not hold every attachment in memory until the Excel update at the end
+                    for pdf_data in pdf_analysis.values():
+                        if isinstance(pdf_data, dict):
+                            pdf_data['payload'] = None
                 else:
                     print("   ⚠️  No PDF analysis data found")
                 
@@ -1608,6 +1613,9 @@ def process_invoices():
             print(f"   ❌ Error processing email {i+1}: {e}")
             continue
     
+    if progress_callback:
+        progress_callback(len(recent_emails), len(recent_emails))
+    
     # Mark processed emails as read
     if processed_invoice_ids:
         try:
@@ -1685,16 +1693,21 @@ def normalize_booking_code_value(value):
 
 def find_matching_column(df, field_name):
     """Find the matching column in DataFrame for a given field (same as email_to_excel_mapper.py)"""
+    return find_matching_column_in_columns(tuple(df.columns), field_name)
+
+@functools.lru_cache(maxsize=256)
+def find_matching_column_in_columns(columns, field_name):
+    """find_matching_column on a tuple of column names - memoized, the same sheet layout is matched on every run"""
     # Normalize field name for matching
     normalized_field = normalize_column_name(field_name)
     
     # Try exact match first
-    for col in df.columns:
+    for col in columns:
         if normalize_column_name(col) == normalized_field:
             return col
     
     # Try partial match
-    for col in df.columns:
+    for col in columns:
         col_normalized = normalize_column_name(col)
         if normalized_field in col_normalized or col_normalized in normalized_field:
             return col
@@ -1710,7 +1723,7 @@ def find_matching_column(df, field_name):
         'payment': ['payment', 'amount', 'total', 'paid'],
     }
     
-    for col in df.columns:
+    for col in columns:
         col_normalized = normalize_column_name(col)
         for key, variations in field_variations.items():
             if key in normalized_field:
@@ -1745,7 +1758,7 @@ def read_matching_excel_file():
         
         # Try reading with pandas
         print(f"   📄 File size: {file_size:,} bytes")
-        df = pd.read_excel(MATCHING_EXCEL_FILE_PATH, engine='openpyxl', header=0)
+        df = pd.read_excel(MATCHING_EXCEL_FILE_PATH, engine='calamine', header=0)
         print(f"✅ Read Excel file: {len(df)} rows, {len(df.columns)} columns")
         print(f"📋 Columns: {list(df.columns)}")
         return df
@@ -1777,15 +1790,13 @@ def read_invoice_master_sheet_from_drive(drive_uploader):
             mimeType='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
         )
         
-        # Download to temporary file
-        temp_sheet_file = 'temp_invoice_master.xlsx'
-        with open(temp_sheet_file, 'wb') as f:
-            f.write(request.execute())
+        # Download into memory - no temp file to write, re-read and clean up
+        sheet_buffer = io.BytesIO(request.execute())
         
         print(f"   ✅ Downloaded Invoice Master Sheet")
         
         # Read Excel file with pandas
-        df = pd.read_excel(temp_sheet_file, engine='openpyxl', header=0)
+        df = pd.read_excel(sheet_buffer, engine='calamine', header=0)
         print(f"   ✅ Read {len(df)} rows from Invoice Master Sheet")
         print(f"   📋 Columns: {list(df.columns)}")
         
@@ -1846,15 +1857,6 @@ def read_invoice_master_sheet_from_drive(drive_uploader):
         
         print(f"   ✅ Extracted {len(extracted_data_list)} entries from Invoice Master Sheet")
         
-        # Clean up temp file
-        try:
-            import time
-            time.sleep(0.3)
-            if os.path.exists(temp_sheet_file):
-                os.remove(temp_sheet_file)
-        except:
-            pass
-        
         return extracted_data_list
         
     except Exception as e:
@@ -2615,6 +2617,9 @@ def match_master_sheet_with_excel():
 
 if __name__ == "__main__":
     import sys
+    from openai_vision_extractor import show_status_messages
+    # Show the AWS Bedrock extractor's status messages alongside the processor output
+    show_status_messages(sys.stdout)
     # Check if running matching function standalone
     if len(sys.argv) > 1 and sys.argv[1] == '--match':
         match_master_sheet_with_excel()
@@ -964,4 +964,8 @@ def process_invoices():
     mail.logout()
 
 if __name__ == "__main__":
+    import sys
+    from openai_vision_extractor import show_status_messages
+    # Show the AWS Bedrock extractor's status messages alongside the processor output
+    show_status_messages(sys.stdout)
     process_invoices()
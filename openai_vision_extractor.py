@@ -5,150 +5,112 @@ Extracts structured data from PDFs, images, and text using AWS Bedrock models
 """
 
 import os
+import contextvars
 import json
-import base64
+import logging
 import re
-import boto3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-class OpenAIPropertyExtractor:
-    """Extract structured data using AWS Bedrock models"""
-    
-    def __init__(self):
-        """Initialize the extractor with AWS Bedrock configuration"""
-        self.enabled = os.getenv('ENABLE_OPENAI_VISION', 'false').lower() == 'true'
-        self.bedrock_model = os.getenv('AWS_BEDROCK_MODEL', 'amazon.nova-pro-v1:0')
-        self.aws_region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-        self.aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-        self.aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-        
-        self.client = None
-        
-        if self.enabled:
-            try:
-                self.client = boto3.client(
-                    "bedrock-runtime",
-                    aws_access_key_id=self.aws_access_key_id,
-                    aws_secret_access_key=self.aws_secret_access_key,
-                    region_name=self.aws_region
-                )
-                print(f"   ✅ AWS Bedrock client initialized (Model: {self.bedrock_model})")
-            except Exception as e:
-                print(f"   ⚠️  Failed to initialize AWS Bedrock client: {e}")
-                self.enabled = False
-                self.client = None
+# Status goes through logging rather than print - entry points configure the output once,
+# and the per-call DEBUG traces cost nothing when that level is disabled
+logger = logging.getLogger(__name__)
+
+
+def show_status_messages(stream=None):
+    """Print this module's INFO status messages to stream (stderr by default)
+    Only this module's logger is configured, so botocore, googleapiclient and other libraries keep
+    their INFO logs to themselves. Calling it again (e.g. on a Streamlit rerun) adds no second handler."""
+    if not any(type(handler) is logging.StreamHandler for handler in logger.handlers):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+# Words that appear in the text layer of any hotel invoice/folio - PDFs without a single one
+# (terms & conditions, brochures, policy documents) are not worth a Bedrock call when the caller
+# asks for them to be skipped (skip_non_invoice=True)
+INVOICE_TEXT_MARKERS = re.compile(
+    r'invoice|bill|folio|receipt|gst|tax|amount|total|tariff|room|guest|check[\s-]?(?:in|out)|arrival|departure|hotel',
+    re.IGNORECASE
+)
+
+# Returned with skip_non_invoice=True for a PDF whose text has none of the markers above,
+# so callers can tell "not an invoice, Bedrock skipped" apart from a failed extraction
+NON_INVOICE_PDF = 'NON_INVOICE_PDF'
+
+# Bedrock errors worth retrying that botocore's own retries leave alone - throttling, 5xx errors and
+# connection/read timeouts are already retried by the client (adaptive mode, see the client property)
+BEDROCK_TRANSIENT_ERRORS = {
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+}
+BEDROCK_MAX_ATTEMPTS = 3
+
+# Reasoning models (DeepSeek-R1, e.g. deepseek.r1-v1:0) spend output tokens thinking before they answer,
+# so the trimmed per-extraction budgets below would cut them off mid-reasoning
+REASONING_MODEL_PATTERN = re.compile(r'(?:^|[.\-])r1(?:[.\-:]|$)', re.IGNORECASE)
+
+# ValidationException messages meaning the prompt exceeded the model's input limit
+INPUT_TOO_LONG_PATTERN = re.compile(r'too long|too many (?:input )?tokens|exceeds? (?:the )?(?:max|context)', re.IGNORECASE)
+
+# Layout padding in PDF text layers: runs of spaces/tabs used for column alignment, dot/dash/underscore
+# leaders between a label and its amount, and stacks of blank lines - none of it helps the model
+HORIZONTAL_PADDING_PATTERN = re.compile(r'[ \t\xa0]{2,}')
+LEADER_PATTERN = re.compile(r'([.\-_=*])\1{3,}')
+TRAILING_SPACE_PATTERN = re.compile(r'[ \t]+\n')
+BLANK_LINES_PATTERN = re.compile(r'\n{3,}')
+
+
+def compact_pdf_text(text):
+    """Strip layout padding from extracted PDF text so the character budget holds invoice content"""
+    text = LEADER_PATTERN.sub(r'\1\1\1', text)
+    text = HORIZONTAL_PADDING_PATTERN.sub(' ', text)
+    text = TRAILING_SPACE_PATTERN.sub('\n', text)
+    return BLANK_LINES_PATTERN.sub('\n\n', text)
+
+
+# Labels of the invoice extraction output format and the pdf_analysis keys they fill
+INVOICE_FIELD_KEYS = {
+    'HOTEL': 'hotel_name',
+    'GUEST': 'guest_name',
+    'BILL NO': 'bill_number',
+    'BILL DATE': 'bill_date',
+    'CHECK-IN': 'arrival_date',
+    'CHECK-OUT': 'departure_date',
+    'ROOM': 'room_number',
+    'GUESTS': 'number_of_pax',
+    'AMOUNT': 'total_amount',
+    'GST': 'gst_number',
+    'PAN': 'pan_number',
+}
+
+# One pass over the response; [ \t]* (not \s*) so an empty field never swallows the next line
+INVOICE_FIELD_PATTERN = re.compile(
+    r'\b(HOTEL|GUESTS|GUEST|BILL NO|BILL DATE|CHECK-IN|CHECK-OUT|ROOM|AMOUNT|GST|PAN)[ \t]*:[ \t]*([^\n]*)'
+)
+
+def parse_invoice_fields(invoice_text):
+    """Parse the "LABEL: value" invoice extraction output into a dict keyed like pdf_analysis
+    Only fields with a non-empty value are returned; the first occurrence of a label wins."""
+    fields = {}
+    if not invoice_text:
+        return fields
     
-    def _invoke_bedrock_text(self, prompt):
-        """Invoke AWS Bedrock with text-only input - simplified approach"""
-        if not self.enabled or not self.client:
-            return None
-        
-        try:
-            model_id = self.bedrock_model.lower()
-            
-            # For Amazon Nova models - use Messages API format
-            # Nova requires content to be a JSONArray, not a string
-            if 'nova' in model_id or 'amazon' in model_id:
-                body = {
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": [
-                                {
-                                    "text": prompt
-                                }
-                            ]
-                        }
-                    ],
-                    "inferenceConfig": {
-                        "maxTokens": 8192,
-                        "temperature": 0.1
-                    }
-                }
-            # For Claude/Anthropic models
-            elif 'claude' in model_id or 'anthropic' in model_id:
-                body = {
-                    "anthropic_version": "bedrock-2023-05-31",
-                    "max_tokens": 8192,
-                    "temperature": 0.1,
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ]
-                }
-            # For other models - try simple prompt format
-            else:
-                body = {
-                    "prompt": prompt,
-                    "max_tokens": 8192,
-                    "temperature": 0.1
-                }
-            
-            body_json = json.dumps(body)
-            
-            # Invoke the model
-            response = self.client.invoke_model(
-                modelId=self.bedrock_model,
-                body=body_json,
-                contentType="application/json",
-                accept="application/json"
-            )
-            
-            # Parse response
-            response_body = json.loads(response['body'].read())
-            
-            # Extract text based on response format
-            if 'nova' in model_id or 'amazon' in model_id:
-                # Nova format: {"output": {"message": {"content": [{"text": "..."}]}}}
-                try:
-                    return response_body['output']['message']['content'][0]['text']
-                except (KeyError, IndexError, TypeError):
-                    # Try alternative paths
-                    return response_body.get('output', {}).get('message', {}).get('content', '')
-            elif 'claude' in model_id or 'anthropic' in model_id:
-                return response_body.get('content', [{}])[0].get('text', '')
-            else:
-                # Try common response formats
-                return (response_body.get('generation') or 
-                       response_body.get('outputs', [{}])[0].get('text', '') or
-                       response_body.get('results', [{}])[0].get('outputText', '') or
-                       str(response_body))
-                
-        except Exception as e:
-            print(f"   ⚠️  Error invoking AWS Bedrock: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+    for match in INVOICE_FIELD_PATTERN.finditer(invoice_text):
+        key = INVOICE_FIELD_KEYS[match.group(1)]
+        value = match.group(2).strip()
+        if value and key not in fields:
+            fields[key] = value
     
-    def extract_comprehensive_invoice_data_from_pdf(self, pdf_data):
-        """Extract comprehensive invoice data from PDF using AWS Bedrock
-        Extracts text from PDF first, then uses Bedrock to analyze and extract structured data"""
-        if not self.enabled or not self.client:
-            return None
-        
-        try:
-            # Extract text from PDF using PyPDF2
-            import PyPDF2
-            import io
-            
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
-            pdf_text = ""
-            for page in pdf_reader.pages:
-                pdf_text += page.extract_text() + "\n"
-            
-            if not pdf_text or len(pdf_text.strip()) < 50:
-                print(f"   ⚠️  Could not extract sufficient text from PDF")
-                return None
-            
-            # Limit text size to avoid token limits (keep first 20000 chars)
-            text_snippet = pdf_text[:20000] if len(pdf_text) > 20000 else pdf_text
-            
-            prompt = f"""You are an expert invoice data extraction system. Analyze the following invoice PDF text and extract structured information.
+    return fields
+
+# Prompt templates - built once at import and filled per call with str.format
+INVOICE_EXTRACTION_PROMPT = """You are an expert invoice data extraction system. Analyze the following invoice PDF text and extract structured information.
 
 Extract the following fields from the invoice:
 
@@ -184,44 +146,47 @@ AMOUNT: <value or empty>
 GST: <value or empty>
 PAN: <value or empty>"""
 
-            print(f"   🤖 Using AWS Bedrock ({self.bedrock_model}) to extract invoice data from PDF...")
-            result = self._invoke_bedrock_text(prompt)
-            
-            if result:
-                print(f"   ✅ AWS Bedrock extracted invoice data")
-                return result
-            else:
-                print(f"   ⚠️  AWS Bedrock extraction returned no data")
-                return None
-                
-        except Exception as e:
-            print(f"   ❌ Error extracting invoice data from PDF: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
-    
-    def extract_property_name_from_pdf(self, pdf_data):
-        """Extract property/hotel name from PDF using AWS Bedrock"""
-        if not self.enabled or not self.client:
-            return None
-        
-        try:
-            # Extract text from PDF using PyPDF2
-            import PyPDF2
-            import io
-            
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
-            pdf_text = ""
-            for page in pdf_reader.pages:
-                pdf_text += page.extract_text() + "\n"
-            
-            if not pdf_text or len(pdf_text.strip()) < 50:
-                return None
-            
-            # Limit text size (keep first 10000 chars for hotel name extraction)
-            text_snippet = pdf_text[:10000] if len(pdf_text) > 10000 else pdf_text
-            
-            prompt = f"""You are an expert at extracting hotel/property names from invoices. 
+BATCH_INVOICE_EXTRACTION_PROMPT = """You are an expert invoice data extraction system. Analyze each of the following {invoice_count} invoice PDF texts and extract structured information for every invoice separately.
+
+Extract the following fields from each invoice:
+
+HOTEL: <hotel name or property name>
+GUEST: <guest name or customer name>
+BILL NO: <bill number or invoice number>
+BILL DATE: <bill date or invoice date>
+CHECK-IN: <check-in date or arrival date>
+CHECK-OUT: <check-out date or departure date>
+ROOM: <room number>
+GUESTS: <number of guests or pax>
+AMOUNT: <total amount or grand total>
+GST: <GST number if available>
+PAN: <PAN number if available>
+
+Note: Booking code is extracted from email, not PDF.
+
+If a field is not found, leave it empty. Extract dates in their original format.
+Never mix values from different invoices.
+
+{invoices_text}
+
+OUTPUT FORMAT (repeat the block for every invoice, numbered as in the input):
+INVOICE 1:
+HOTEL: <value or empty>
+GUEST: <value or empty>
+BILL NO: <value or empty>
+BILL DATE: <value or empty>
+CHECK-IN: <value or empty>
+CHECK-OUT: <value or empty>
+ROOM: <value or empty>
+GUESTS: <value or empty>
+AMOUNT: <value or empty>
+GST: <value or empty>
+PAN: <value or empty>
+
+INVOICE 2:
+..."""
+
+HOTEL_NAME_PROMPT = """You are an expert at extracting hotel/property names from invoices. 
 
 Analyze the following invoice text and extract ONLY the hotel name or property name. 
 Look for words like "Hotel", "Resort", "Inn", "Lodge", "Palace", etc. followed by the property name.
@@ -233,60 +198,7 @@ INVOICE TEXT:
 
 HOTEL NAME:"""
 
-            print(f"   🤖 Using AWS Bedrock ({self.bedrock_model}) to extract hotel name...")
-            result = self._invoke_bedrock_text(prompt)
-            
-            if result:
-                # Clean up the response - extract just the hotel name
-                hotel_name = result.strip()
-                # Remove any labels like "HOTEL NAME:" or "Hotel:" from the response
-                hotel_name = re.sub(r'^(?:HOTEL\s*NAME|HOTEL|PROPERTY|PROPERTY\s*NAME)[:\s]*', '', hotel_name, flags=re.IGNORECASE)
-                hotel_name = hotel_name.strip()
-                
-                if hotel_name and hotel_name.lower() not in ['not found', 'none', 'n/a', '']:
-                    print(f"   ✅ Extracted hotel name: {hotel_name}")
-                    return hotel_name
-            
-            return None
-                
-        except Exception as e:
-            print(f"   ⚠️  Error extracting hotel name from PDF: {e}")
-            return None
-    
-    def extract_comprehensive_invoice_data_from_jpeg(self, jpeg_data):
-        """Extract comprehensive invoice data from JPEG using AWS Bedrock"""
-        # For JPEG images, we would need Bedrock's vision capabilities
-        # For now, return None - JPEG processing requires vision API
-        return None
-    
-    def extract_booking_details_from_email(self, email_body, email_html=None, email_subject=None):
-        """Extract booking details from email body/text using AWS Bedrock
-        Focuses on extracting from HTML tables where booking data is typically structured"""
-        if not self.enabled or not self.client:
-            return None
-        
-        # Use HTML if available, otherwise use plain text
-        # Prefer HTML as it contains more structured data (tables are usually in HTML)
-        text_to_analyze = email_html if email_html else email_body
-        
-        if not text_to_analyze:
-            return None
-        
-        # Combine subject and body for analysis (booking codes are often in subject)
-        if email_subject:
-            combined_text = f"EMAIL SUBJECT: {email_subject}\n\nEMAIL BODY:\n{text_to_analyze}"
-            print(f"   📧 Including email subject in analysis")
-        else:
-            combined_text = text_to_analyze
-        
-        # Use the FULL email content (up to 30000 chars to capture entire email)
-        # This ensures we analyze the complete email including all tables and sections
-        # Take your time - analyze thoroughly
-        text_snippet = combined_text[:30000] if len(combined_text) > 30000 else combined_text
-        
-        print(f"   📧 Email content length: {len(text_snippet)} characters")
-        
-        prompt = f"""You are an expert data extraction system. Your task is to carefully analyze the ENTIRE email (including subject line) and extract ONLY actual data values.
+BOOKING_DETAILS_PROMPT = """You are an expert data extraction system. Your task is to carefully analyze the ENTIRE email (including subject line) and extract ONLY actual data values.
 
 ⚠️ CRITICAL RULE - READ THIS FIRST:
 DO NOT EXTRACT FIELD LABELS OR HEADERS AS VALUES!
@@ -468,23 +380,483 @@ Now carefully analyze the email below. Remember:
 2. BOOKING CODE is the MOST IMPORTANT field - find it!
 """
 
-        print(f"   🤖 Using AWS Bedrock ({self.bedrock_model}) to extract booking details...")
-        print(f"   📧 Analyzing email content ({len(text_snippet)} characters)...")
+class OpenAIPropertyExtractor:
+    """Extract structured data using AWS Bedrock models"""
+    
+    def __init__(self, client=None):
+        """Initialize the extractor with AWS Bedrock configuration
+        client: an existing bedrock-runtime client to reuse instead of creating one"""
+        self.enabled = os.getenv('ENABLE_OPENAI_VISION', 'false').lower() == 'true'
+        self.bedrock_model = os.getenv('AWS_BEDROCK_MODEL', 'amazon.nova-pro-v1:0')
+        self.aws_region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
+        self.aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
+        self.aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
+        # Output token budgets - Bedrock reserves max_tokens against the account quota on every
+        # request, so PDF field extraction (a dozen short lines) and hotel-name lookups (one line)
+        # ask for far less than email parsing. Reasoning models keep the full budget by default.
+        self.max_tokens = int(os.getenv('AWS_BEDROCK_MAX_TOKENS', '8192'))
+        is_reasoning_model = bool(REASONING_MODEL_PATTERN.search(self.bedrock_model))
+        self.pdf_max_tokens = int(os.getenv('AWS_BEDROCK_PDF_MAX_TOKENS',
+                                            self.max_tokens if is_reasoning_model else 1024))
+        self.name_max_tokens = int(os.getenv('AWS_BEDROCK_NAME_MAX_TOKENS',
+                                             self.pdf_max_tokens if is_reasoning_model else min(256, self.pdf_max_tokens)))
+        # Upper bound on Bedrock requests in flight at once (per-invoice fallback calls)
+        self.max_concurrency = max(int(os.getenv('AWS_BEDROCK_MAX_CONCURRENCY', '4')), 1)
+        
+        # The Bedrock client is created on first use (see the client property), so an
+        # extractor that is disabled or never called does not pay for boto3 at all
+        self._client = client
+    
+    @property
+    def client(self):
+        """AWS Bedrock runtime client, created on first access"""
+        if self._client is None and self.enabled:
+            try:
+                import boto3
+                from botocore.config import Config
+                # Keep-alive pool large enough for every concurrent fallback request, and adaptive
+                # retries so botocore paces requests client-side once Bedrock starts throttling
+                config = Config(
+                    max_pool_connections=max(self.max_concurrency, 10),
+                    retries={'mode': 'adaptive', 'max_attempts': 3}
+                )
+                self._client = boto3.client(
+                    "bedrock-runtime",
+                    aws_access_key_id=self.aws_access_key_id,
+                    aws_secret_access_key=self.aws_secret_access_key,
+                    region_name=self.aws_region,
+                    config=config
+                )
+                logger.info("   ✅ AWS Bedrock client initialized (Model: %s)", self.bedrock_model)
+            except Exception as e:
+                logger.warning("   ⚠️  Failed to initialize AWS Bedrock client: %s", e)
+                self.enabled = False
+                self._client = None
+        return self._client
+    
+    def _invoke_bedrock_text(self, prompt, max_tokens=None, shrink_prompt=None):
+        """Invoke AWS Bedrock with text-only input - simplified approach
+        Model-not-ready and model-timeout errors are retried with exponential backoff (throttling and
+        connection errors are retried by botocore itself, so they are not retried again here).
+        If the model rejects the input as too long and shrink_prompt is given, it is called
+        once to build a smaller prompt (e.g. half the document text) which is sent instead."""
+        if not self.enabled or not self.client:
+            return None
+        
+        if max_tokens is None:
+            max_tokens = self.max_tokens
+        
+        attempt = 0
+        while True:
+            try:
+                return self._invoke_bedrock_once(prompt, max_tokens)
+            except Exception as e:
+                error_code = getattr(e, 'response', {}).get('Error', {}).get('Code', '')
+                
+                if shrink_prompt and error_code == 'ValidationException' and INPUT_TOO_LONG_PATTERN.search(str(e)):
+                    smaller_prompt = shrink_prompt()
+                    shrink_prompt = None
+                    if smaller_prompt:
+                        logger.warning("   ⚠️  Input too long for %s - retrying with half the text", self.bedrock_model)
+                        prompt = smaller_prompt
+                        continue
+                
+                if error_code in BEDROCK_TRANSIENT_ERRORS and attempt < BEDROCK_MAX_ATTEMPTS - 1:
+                    delay = min(2 ** attempt, 10)
+                    logger.warning("   ⚠️  AWS Bedrock %s - retrying in %ss...", error_code, delay)
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                
+                logger.exception("   ⚠️  Error invoking AWS Bedrock: %s", e)
+                return None
+    
+    def _invoke_bedrock_once(self, prompt, max_tokens):
+        """Send a single invoke_model request and return the response text (errors propagate)"""
+        model_id = self.bedrock_model.lower()
+        
+        # For Amazon Nova models - use Messages API format
+        # Nova requires content to be a JSONArray, not a string
+        if 'nova' in model_id or 'amazon' in model_id:
+            body = {
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {
+                                "text": prompt
+                            }
+                        ]
+                    }
+                ],
+                "inferenceConfig": {
+                    "maxTokens": max_tokens,
+                    "temperature": 0.1
+                }
+            }
+        # For Claude/Anthropic models
+        elif 'claude' in model_id or 'anthropic' in model_id:
+            body = {
+                "anthropic_version": "bedrock-2023-05-31",
+                "max_tokens": max_tokens,
+                "temperature": 0.1,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": prompt
+                    }
+                ]
+            }
+        # For other models - try simple prompt format
+        else:
+            body = {
+                "prompt": prompt,
+                "max_tokens": max_tokens,
+                "temperature": 0.1
+            }
+        
+        # Serialize straight to compact UTF-8 bytes: botocore sends bytes as-is, and
+        # ensure_ascii=False keeps non-ASCII invoice text (₹, accents) from 6-byte \u escapes
+        body_json = json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        
+        # Invoke the model
+        response = self.client.invoke_model(
+            modelId=self.bedrock_model,
+            body=body_json,
+            contentType="application/json",
+            accept="application/json"
+        )
+        
+        # Parse response
+        response_body = json.loads(response['body'].read())
+        
+        # Extract text based on response format
+        if 'nova' in model_id or 'amazon' in model_id:
+            # Nova format: {"output": {"message": {"content": [{"text": "..."}]}}}
+            try:
+                return response_body['output']['message']['content'][0]['text']
+            except (KeyError, IndexError, TypeError):
+                # Try alternative paths
+                return response_body.get('output', {}).get('message', {}).get('content', '')
+        elif 'claude' in model_id or 'anthropic' in model_id:
+            return response_body.get('content', [{}])[0].get('text', '')
+        else:
+            # Try common response formats
+            return (response_body.get('generation') or 
+                   response_body.get('outputs', [{}])[0].get('text', '') or
+                   response_body.get('results', [{}])[0].get('outputText', '') or
+                   str(response_body))
+    
+    @staticmethod
+    def _iter_pdf_page_texts(pdf_reader, reverse=False):
+        """Yield (page_index, text) for each page of an open PdfReader in turn - last page first
+        when reverse=True - so only the current page is held in memory"""
+        page_indices = range(len(pdf_reader.pages))
+        if reverse:
+            page_indices = reversed(page_indices)
+        for page_index in page_indices:
+            yield page_index, compact_pdf_text(pdf_reader.pages[page_index].extract_text()) + "\n"
+    
+    @staticmethod
+    def _clip_text(text, max_chars):
+        """Fit text into max_chars, keeping the start and the end of the document
+        Invoice fields cluster in the header (hotel, guest, bill details) and in the closing
+        totals/GST block, so the middle of a long folio is what gets dropped. Layout padding is
+        compacted first, so text passed in by callers gets the same treatment as text read here."""
+        text = compact_pdf_text(text)
+        if len(text) <= max_chars:
+            return text
+        separator = "\n...\n"
+        head_chars = max_chars * 3 // 4
+        tail_chars = max_chars - head_chars - len(separator)
+        return text[:head_chars] + separator + text[-tail_chars:]
+    
+    def _read_pdf_text(self, pdf_data, max_chars=None):
+        """Extract the text layer of a PDF using PyPDF2
+        With max_chars, only the opening and closing pages that _clip_text will keep are read;
+        the pages in between are never extracted."""
+        import PyPDF2
+        import io
+        
+        # One reader serves both passes - building it parses the PDF's xref and page tree
+        pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_data))
+        
+        # Collect page texts and join once - repeated string += copies the whole text per page
+        head_pages = []
+        text_length = 0
+        last_head_index = None
+        pages_remaining = False
+        for page_index, page_text in self._iter_pdf_page_texts(pdf_reader):
+            if max_chars is not None and text_length >= max_chars * 3 // 4:
+                pages_remaining = True
+                break
+            head_pages.append(page_text)
+            text_length += len(page_text)
+            last_head_index = page_index
+        
+        if not pages_remaining:
+            return "".join(head_pages)
+        
+        # Read backwards from the last page until the tail share of the budget is covered
+        tail_pages = []
+        text_length = 0
+        for page_index, page_text in self._iter_pdf_page_texts(pdf_reader, reverse=True):
+            if page_index <= last_head_index or text_length >= max_chars // 4:
+                break
+            tail_pages.append(page_text)
+            text_length += len(page_text)
+        
+        return "".join(head_pages) + "".join(reversed(tail_pages))
+    
+    def extract_comprehensive_invoice_data_from_pdf(self, pdf_data, pdf_text=None, skip_non_invoice=False):
+        """Extract comprehensive invoice data from PDF using AWS Bedrock
+        Extracts text from PDF first, then uses Bedrock to analyze and extract structured data.
+        Pass pdf_text when the caller has already extracted the PDF text to skip re-parsing it.
+        skip_non_invoice: don't send a PDF without invoice markers to Bedrock, return NON_INVOICE_PDF instead."""
+        if not self.enabled or not self.client:
+            return None
+        
+        try:
+            # Extract text from PDF using PyPDF2 (unless the caller already did)
+            if pdf_text is None:
+                pdf_text = self._read_pdf_text(pdf_data, max_chars=20000)
+            
+            if not pdf_text or len(pdf_text.strip()) < 50:
+                logger.warning("   ⚠️  Could not extract sufficient text from PDF")
+                return None
+            
+            if skip_non_invoice and not INVOICE_TEXT_MARKERS.search(pdf_text):
+                logger.info("   ⏭️  PDF text has no invoice fields - skipping AWS Bedrock")
+                return NON_INVOICE_PDF
+            
+            # Limit text size to avoid token limits (20000 chars from the start and end of the invoice)
+            text_snippet = self._clip_text(pdf_text, 20000)
+            
+            prompt = INVOICE_EXTRACTION_PROMPT.format(text_snippet=text_snippet)
+
+            logger.debug("   🤖 Using AWS Bedrock (%s) to extract invoice data from PDF...", self.bedrock_model)
+            result = self._invoke_bedrock_text(
+                prompt,
+                max_tokens=self.pdf_max_tokens,
+                shrink_prompt=lambda: INVOICE_EXTRACTION_PROMPT.format(text_snippet=self._clip_text(pdf_text, 10000))
+            )
+            
+            if result:
+                logger.info("   ✅ AWS Bedrock extracted invoice data")
+                return result
+            else:
+                logger.warning("   ⚠️  AWS Bedrock extraction returned no data")
+                return None
+                
+        except Exception as e:
+            logger.exception("   ❌ Error extracting invoice data from PDF: %s", e)
+            return None
+
+    def extract_comprehensive_invoice_data_from_pdfs(self, pdf_data_list, pdf_texts=None, skip_non_invoice=False):
+        """Extract comprehensive invoice data from several PDFs in a single AWS Bedrock call
+        The extraction instructions are sent once and every invoice is labelled, so an email
+        with N attachments costs one request instead of N. Returns a list aligned with
+        pdf_data_list; any invoice missing from the batched answer is retried on its own.
+        pdf_texts optionally carries already-extracted text for each PDF (None entries are parsed here).
+        skip_non_invoice: don't send PDFs without invoice markers to Bedrock, return NON_INVOICE_PDF for them."""
+        if not self.enabled or not self.client:
+            return [None] * len(pdf_data_list)
+
+        # Own copy - text read below is stored back so later requests for the same PDF reuse it
+        pdf_texts = list(pdf_texts) if pdf_texts is not None else [None] * len(pdf_data_list)
+
+        if len(pdf_data_list) <= 1:
+            return [
+                self.extract_comprehensive_invoice_data_from_pdf(
+                    pdf_data, pdf_text=pdf_text, skip_non_invoice=skip_non_invoice
+                )
+                for pdf_data, pdf_text in zip(pdf_data_list, pdf_texts)
+            ]
+
+        results = [None] * len(pdf_data_list)
+
+        try:
+            # Share the single-invoice text budget between the invoices in the batch
+            per_invoice_limit = max(20000 // len(pdf_data_list), 5000)
+
+            invoice_sections = []
+            batch_positions = []
+            for position, pdf_data in enumerate(pdf_data_list):
+                try:
+                    pdf_text = pdf_texts[position]
+                    if pdf_text is None:
+                        pdf_text = pdf_texts[position] = self._read_pdf_text(pdf_data, max_chars=per_invoice_limit)
+                except Exception as e:
+                    logger.warning("   ⚠️  Error reading PDF %d: %s", position + 1, e)
+                    continue
+
+                if not pdf_text or len(pdf_text.strip()) < 50:
+                    logger.warning("   ⚠️  Could not extract sufficient text from PDF %d", position + 1)
+                    continue
+
+                if skip_non_invoice and not INVOICE_TEXT_MARKERS.search(pdf_text):
+                    logger.info("   ⏭️  PDF %d text has no invoice fields - skipping AWS Bedrock", position + 1)
+                    results[position] = NON_INVOICE_PDF
+                    continue
+
+                batch_positions.append(position)
+                invoice_sections.append(
+                    f"INVOICE {len(batch_positions)} TEXT:\n{self._clip_text(pdf_text, per_invoice_limit)}"
+                )
+
+            if not batch_positions:
+                return results
+
+            if len(batch_positions) == 1:
+                position = batch_positions[0]
+                results[position] = self.extract_comprehensive_invoice_data_from_pdf(
+                    pdf_data_list[position], pdf_text=pdf_texts[position]
+                )
+                return results
+
+            invoices_text = "\n\n".join(invoice_sections)
+
+            prompt = BATCH_INVOICE_EXTRACTION_PROMPT.format(
+                invoice_count=len(batch_positions), invoices_text=invoices_text
+            )
+
+            logger.debug("   🤖 Using AWS Bedrock (%s) to extract data from %d PDFs in one request...",
+                         self.bedrock_model, len(batch_positions))
+            result = self._invoke_bedrock_text(
+                prompt, max_tokens=min(self.pdf_max_tokens * len(batch_positions), self.max_tokens)
+            )
+
+            if result:
+                # Split the answer on the "INVOICE n:" headers and map blocks back to their PDFs
+                blocks = re.split(r'(?im)^\s*INVOICE\s+(\d+)\s*:\s*$', result)
+                for number, block in zip(blocks[1::2], blocks[2::2]):
+                    index = int(number) - 1
+                    if 0 <= index < len(batch_positions) and 'HOTEL:' in block:
+                        results[batch_positions[index]] = block.strip()
+                logger.info("   ✅ AWS Bedrock extracted invoice data for %d/%d PDFs",
+                            sum(1 for position in batch_positions if results[position]), len(batch_positions))
+            else:
+                logger.warning("   ⚠️  AWS Bedrock batch extraction returned no data")
+
+            # Fall back to one request per invoice for anything the batch did not cover - the requests
+            # are independent and I/O-bound, so they run concurrently (boto3 clients are thread-safe).
+            # Each runs in a copy of the caller's context, so context-scoped state such as the web
+            # app's log capture follows it into the pool threads
+            missing_positions = [position for position in batch_positions if not results[position]]
+            if missing_positions:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(missing_positions))) as executor:
+                    retried = [
+                        executor.submit(
+                            contextvars.copy_context().run,
+                            self.extract_comprehensive_invoice_data_from_pdf,
+                            pdf_data_list[position], pdf_text=pdf_texts[position]
+                        )
+                        for position in missing_positions
+                    ]
+                    for position, future in zip(missing_positions, retried):
+                        results[position] = future.result()
+
+            return results
+
+        except Exception as e:
+            logger.exception("   ❌ Error extracting invoice data from PDFs: %s", e)
+            return results
+
+    def extract_property_name_from_pdf(self, pdf_data, pdf_text=None):
+        """Extract property/hotel name from PDF using AWS Bedrock"""
+        if not self.enabled or not self.client:
+            return None
         
         try:
-            result = self._invoke_bedrock_text(prompt)
+            # Extract text from PDF using PyPDF2 (unless the caller already did)
+            if pdf_text is None:
+                pdf_text = self._read_pdf_text(pdf_data, max_chars=10000)
+            
+            if not pdf_text or len(pdf_text.strip()) < 50:
+                return None
+            
+            # Limit text size (10000 chars from the start and end for hotel name extraction)
+            text_snippet = self._clip_text(pdf_text, 10000)
+            
+            prompt = HOTEL_NAME_PROMPT.format(text_snippet=text_snippet)
+
+            logger.debug("   🤖 Using AWS Bedrock (%s) to extract hotel name...", self.bedrock_model)
+            result = self._invoke_bedrock_text(
+                prompt,
+                max_tokens=self.name_max_tokens,
+                shrink_prompt=lambda: HOTEL_NAME_PROMPT.format(text_snippet=self._clip_text(pdf_text, 5000))
+            )
+            
+            if result:
+                # Clean up the response - extract just the hotel name
+                hotel_name = result.strip()
+                # Remove any labels like "HOTEL NAME:" or "Hotel:" from the response
+                hotel_name = re.sub(r'^(?:HOTEL\s*NAME|HOTEL|PROPERTY|PROPERTY\s*NAME)[:\s]*', '', hotel_name, flags=re.IGNORECASE)
+                hotel_name = hotel_name.strip()
+                
+                if hotel_name and hotel_name.lower() not in ['not found', 'none', 'n/a', '']:
+                    logger.info("   ✅ Extracted hotel name: %s", hotel_name)
+                    return hotel_name
+            
+            return None
+                
+        except Exception as e:
+            logger.warning("   ⚠️  Error extracting hotel name from PDF: %s", e)
+            return None
+    
+    def extract_comprehensive_invoice_data_from_jpeg(self, jpeg_data):
+        """Extract comprehensive invoice data from JPEG using AWS Bedrock"""
+        # For JPEG images, we would need Bedrock's vision capabilities
+        # For now, return None - JPEG processing requires vision API
+        return None
+    
+    def extract_booking_details_from_email(self, email_body, email_html=None, email_subject=None):
+        """Extract booking details from email body/text using AWS Bedrock
+        Focuses on extracting from HTML tables where booking data is typically structured"""
+        if not self.enabled or not self.client:
+            return None
+        
+        # Use HTML if available, otherwise use plain text
+        # Prefer HTML as it contains more structured data (tables are usually in HTML)
+        text_to_analyze = email_html if email_html else email_body
+        
+        if not text_to_analyze:
+            return None
+        
+        # Combine subject and body for analysis (booking codes are often in subject)
+        if email_subject:
+            combined_text = f"EMAIL SUBJECT: {email_subject}\n\nEMAIL BODY:\n{text_to_analyze}"
+            logger.debug("   📧 Including email subject in analysis")
+        else:
+            combined_text = text_to_analyze
+        
+        # Use the FULL email content (up to 30000 chars to capture entire email)
+        # This ensures we analyze the complete email including all tables and sections
+        # Take your time - analyze thoroughly
+        text_snippet = combined_text[:30000] if len(combined_text) > 30000 else combined_text
+        
+        logger.debug("   📧 Email content length: %d characters", len(text_snippet))
+        
+        prompt = BOOKING_DETAILS_PROMPT.format(text_snippet=text_snippet)
+
+        logger.debug("   🤖 Using AWS Bedrock (%s) to extract booking details...", self.bedrock_model)
+        logger.debug("   📧 Analyzing email content (%d characters)...", len(text_snippet))
+        
+        try:
+            result = self._invoke_bedrock_text(
+                prompt,
+                shrink_prompt=lambda: BOOKING_DETAILS_PROMPT.format(text_snippet=text_snippet[:len(text_snippet) // 2])
+            )
             
             if result:
-                print(f"   ✅ AI extraction completed ({len(result)} characters)")
-                print(f"   📋 Raw AI Response preview (first 500 chars):")
-                print(f"   {result[:500]}")
+                logger.info("   ✅ AI extraction completed (%d characters)", len(result))
+                logger.debug("   📋 Raw AI Response preview (first 500 chars):")
+                logger.debug("   %s", result[:500])
                 return result
             else:
-                print(f"   ⚠️  AI extraction returned no data")
+                logger.warning("   ⚠️  AI extraction returned no data")
                 return None
                 
         except Exception as e:
-            print(f"   ❌ Error during AI extraction: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("   ❌ Error during AI extraction: %s", e)
             return None
@@ -9,7 +9,15 @@ import streamlit as st
 import os
 import sys
 import io
-import contextlib
+import contextvars
+import functools
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
 from datetime import datetime
 import pandas as pd
 from dotenv import load_dotenv
@@ -32,6 +40,17 @@ from invoice_processor_final import (
 # Load environment variables
 load_dotenv()
 
+# Route the AWS Bedrock extractor's status messages to the server console (only the extractor's
+# logger - other libraries' INFO logs stay out of the console and the processing log)
+from openai_vision_extractor import show_status_messages
+show_status_messages()
+
+# Local copies of Drive files, reused while the file's modifiedTime/md5Checksum is unchanged
+DRIVE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'invoice_automation_hub')
+
+# "Uploaded PDF to Google Drive: FOLDER/filename" lines printed by process_invoices
+UPLOAD_LOG_PATTERN = re.compile(r"Uploaded PDF to Google Drive:\s*(\w+)/([^\r\n]+)")
+
 # Page configuration
 st.set_page_config(
     page_title="Invoice Automation Hub",
@@ -81,13 +100,100 @@ if 'processing_status' not in st.session_state:
     st.session_state.processing_status = "Ready"
 if 'vendor_reference' not in st.session_state:
     st.session_state.vendor_reference = None
+if 'field_to_column_mapping' not in st.session_state:
+    st.session_state.field_to_column_mapping = None
+
+class TeeStream:
+    """Write target keeping only the last max_lines lines of output, optionally mirrored live to a placeholder"""
+    
+    def __init__(self, placeholder=None, max_lines=2000, refresh_seconds=0.3):
+        self.lines = deque(maxlen=max_lines)
+        self.partial = ''
+        self.uploads_by_folder = Counter()
+        self.placeholder = placeholder
+        self.refresh_seconds = refresh_seconds
+        self.last_refresh = 0.0
+        # Streamlit elements can only be updated from the script thread (worker threads just buffer)
+        self.owner_thread = threading.get_ident()
+        self.lock = threading.Lock()
+    
+    def write(self, text):
+        with self.lock:
+            *complete, self.partial = (self.partial + text).split('\n')
+            for line in complete:
+                self.lines.append(line)
+                self.uploads_by_folder.update(parse_folder_uploads(line))
+        if complete:
+            self.refresh()
+        return len(text)
+    
+    def flush(self):
+        pass
+    
+    def refresh(self, force=False):
+        """Redraw the placeholder, at most once per refresh_seconds unless forced"""
+        if self.placeholder is None or threading.get_ident() != self.owner_thread:
+            return
+        now = time.monotonic()
+        if force or now - self.last_refresh >= self.refresh_seconds:
+            self.last_refresh = now
+            self.placeholder.code(self.getvalue(), language='text')
+    
+    def getvalue(self):
+        with self.lock:
+            return '\n'.join([*self.lines, self.partial])
 
-def capture_output(func, *args, **kwargs):
-    """Capture stdout and stderr from a function call"""
-    output = io.StringIO()
-    error_output = io.StringIO()
+class ContextRoutedStream:
+    """Stand-in for sys.stdout/sys.stderr: writes go to the stream capture_output set for the current
+    context, and to the original stream everywhere else (other sessions, the server itself)"""
     
-    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(error_output):
+    def __init__(self, fallback, capture_target):
+        self.fallback = fallback
+        self.capture_target = capture_target
+    
+    def write(self, text):
+        return (self.capture_target.get() or self.fallback).write(text)
+    
+    def flush(self):
+        (self.capture_target.get() or self.fallback).flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.fallback, name)
+
+class CapturedLogHandler(logging.Handler):
+    """Extractor logger handler writing records to the stream capture_output set for the current context"""
+    
+    def __init__(self, capture_target):
+        super().__init__()
+        self.capture_target = capture_target
+        self.setFormatter(logging.Formatter('%(message)s'))
+    
+    def emit(self, record):
+        output = self.capture_target.get()
+        if output is not None:
+            output.write(self.format(record) + '\n')
+
+@st.cache_resource(show_spinner=False)
+def get_capture_target():
+    """ContextVar holding the stream capture_output is writing to
+    sys.stdout, sys.stderr and the extractor's logger are routed through it once per process (a context is
+    per thread, so runs in other sessions are never mixed in); after Clear Cache the installed one is reused."""
+    if not isinstance(getattr(sys.stdout, 'capture_target', None), contextvars.ContextVar):
+        capture_target = contextvars.ContextVar('capture_target', default=None)
+        sys.stdout = ContextRoutedStream(sys.stdout, capture_target)
+        sys.stderr = ContextRoutedStream(sys.stderr, capture_target)
+        logging.getLogger('openai_vision_extractor').addHandler(CapturedLogHandler(capture_target))
+    return sys.stdout.capture_target
+
+def capture_output(func, *args, stream=None, **kwargs):
+    """Capture stdout, stderr and extractor log records from a function call, in the order they were written
+    Only output from this thread (and the threads it hands work to with its context) is captured.
+    stream: a TeeStream to write to (e.g. one showing the output live); a buffer-only one by default"""
+    output = stream if stream is not None else TeeStream()
+    capture_target = get_capture_target()
+    
+    token = capture_target.set(output)
+    try:
         try:
             result = func(*args, **kwargs)
         except Exception as e:
@@ -95,15 +201,32 @@ def capture_output(func, *args, **kwargs):
             import traceback
             traceback.print_exc()
             result = None
+    finally:
+        capture_target.reset(token)
+        output.refresh(force=True)
     
-    stdout_text = output.getvalue()
-    stderr_text = error_output.getvalue()
-    
-    # Combine outputs
-    combined_output = stdout_text + stderr_text
-    
-    return result, combined_output
+    return result, output.getvalue()
+
+@dataclass(frozen=True)
+class AppEnv:
+    """Settings the tabs display or branch on, read from the environment
+    (DAYS_TO_SEARCH is not included - the Process tab rewrites it, so it is always read live)"""
+    gmail_email: str
+    drive_enabled: bool
+    bedrock_enabled: bool
+    bedrock_model: str
 
+@st.cache_resource(ttl=300, show_spinner=False)
+def app_env():
+    """AppEnv snapshot shared across reruns, re-read every 5 minutes like check_configuration"""
+    return AppEnv(
+        gmail_email=os.getenv('GMAIL_EMAIL', 'Not set'),
+        drive_enabled=os.getenv('ENABLE_GOOGLE_DRIVE_UPLOAD', 'false').lower() == 'true',
+        bedrock_enabled=os.getenv('ENABLE_OPENAI_VISION', 'false').lower() == 'true',
+        bedrock_model=os.getenv('AWS_BEDROCK_MODEL', 'Not set')
+    )
+
+@st.cache_data(ttl=300, show_spinner=False)
 def check_configuration():
     """Check if all required configuration is set"""
     required_vars = {
@@ -124,35 +247,148 @@ def check_configuration():
     
     return required_vars, optional_vars
 
+def parse_folder_uploads(logs):
+    """Count Drive uploads per folder from captured processing output (one pass over the whole log)"""
+    return Counter(match.group(1) for match in UPLOAD_LOG_PATTERN.finditer(logs))
+
+@st.cache_data(show_spinner=False)
+def get_config_table(rows):
+    """Setting/Value DataFrame for the dashboard, built once per distinct tuple of (setting, value) rows"""
+    return pd.DataFrame(list(rows), columns=["Setting", "Value"])
+
+@st.cache_data(ttl=600, show_spinner=False)
+def get_vendor_reference():
+    """load_vendor_reference cached across reruns - the reference sheet rarely changes"""
+    return load_vendor_reference()
+
+def logout_imap_connection(mail):
+    """Log out an IMAP connection that is being replaced or released (best effort - it may already be dead)"""
+    try:
+        mail.logout()
+    except Exception:
+        pass
+
+@st.cache_resource(show_spinner=False, scope='session', on_release=logout_imap_connection)
+def get_imap_connection():
+    """Logged-in Gmail IMAP connection kept open across this session's reruns (no TLS handshake + login per check)
+    imaplib is not thread-safe - only use it while holding get_imap_lock()."""
+    import imaplib
+    mail = imaplib.IMAP4_SSL(
+        os.getenv('IMAP_SERVER', 'imap.gmail.com'),
+        int(os.getenv('IMAP_PORT', '993'))
+    )
+    mail.login(os.getenv('GMAIL_EMAIL'), os.getenv('GMAIL_PASSWORD'))
+    mail.select('inbox')
+    return mail
+
+@st.cache_resource(show_spinner=False, scope='session')
+def get_imap_lock():
+    """Serializes use of this session's IMAP connection (dashboard probe and test buttons run in worker threads)"""
+    return threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def get_bedrock_client():
+    """AWS Bedrock runtime client shared by every processing run (None when AWS Bedrock is disabled)"""
+    from openai_vision_extractor import OpenAIPropertyExtractor
+    return OpenAIPropertyExtractor().client
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def get_matching_dataframe(excel_mtime):
+    """read_matching_excel_file cached per file modification time (callers must copy before editing)"""
+    return read_matching_excel_file()
+
+@st.cache_data(ttl=60, show_spinner=False)
 def test_gmail_connection():
-    """Test Gmail IMAP connection"""
+    """Test Gmail IMAP connection (result cached for a minute; the check is a NOOP on the session's connection)"""
     try:
         import imaplib
-        mail = imaplib.IMAP4_SSL(
-            os.getenv('IMAP_SERVER', 'imap.gmail.com'),
-            int(os.getenv('IMAP_PORT', '993'))
-        )
-        mail.login(os.getenv('GMAIL_EMAIL'), os.getenv('GMAIL_PASSWORD'))
-        mail.select('inbox')
-        mail.close()
-        mail.logout()
+        with get_imap_lock():
+            # A failed login raises here and is not retried - a second attempt with the same
+            # credentials would only count as another failed login against the account
+            mail = get_imap_connection()
+            try:
+                mail.noop()
+            except (imaplib.IMAP4.abort, OSError):
+                # Connection dropped by the server (idle timeout) - clearing logs the stale one
+                # out (on_release), then reconnect once
+                get_imap_connection.clear()
+                get_imap_connection().noop()
         return True, "✅ Gmail connection successful!"
     except Exception as e:
         return False, f"❌ Gmail connection failed: {e}"
 
+@st.cache_resource(show_spinner=False, scope='session')
+def get_drive_uploader():
+    """Authenticated GoogleDriveUploader reused across this session's reruns
+    Its httplib2-backed service is not thread-safe, so it is never shared between sessions or handed
+    to the processing worker. Raises on failure so a failed authentication is not cached."""
+    from google_drive_uploader import GoogleDriveUploader
+    drive_uploader = GoogleDriveUploader()
+    if not drive_uploader.authenticate():
+        raise RuntimeError("Google Drive authentication failed")
+    return drive_uploader
+
+@st.cache_data(ttl=60, show_spinner=False)
 def test_google_drive_connection():
-    """Test Google Drive connection"""
+    """Test Google Drive connection (result cached for a minute; the check is a real API request,
+    not just the cached authentication)"""
     try:
-        from google_drive_uploader import GoogleDriveUploader
-        drive_uploader = GoogleDriveUploader()
-        if drive_uploader.authenticate():
-            return True, "✅ Google Drive connection successful!"
-        else:
-            return False, "❌ Google Drive authentication failed"
+        get_drive_uploader().service.about().get(fields='user').execute()
+        return True, "✅ Google Drive connection successful!"
     except Exception as e:
         return False, f"❌ Google Drive connection failed: {e}"
 
-def read_file_from_drive_fixed(file_id, drive_uploader, temp_filename='temp_drive_file.xlsx'):
+def load_cached_drive_file(file_id, cache_key):
+    """Return the cached DataFrame for a Drive file if it was saved for the same cache_key, else None"""
+    meta_path = os.path.join(DRIVE_CACHE_DIR, f"{file_id}.json")
+    data_path = os.path.join(DRIVE_CACHE_DIR, f"{file_id}.pkl")
+    try:
+        with open(meta_path, 'r') as f:
+            if json.load(f).get('cache_key') != cache_key:
+                return None
+        return pd.read_pickle(data_path)
+    except Exception:
+        return None
+
+def save_cached_drive_file(file_id, cache_key, df):
+    """Save a Drive file's DataFrame with its cache_key (pickle keeps mixed date/text columns as-is)"""
+    try:
+        os.makedirs(DRIVE_CACHE_DIR, exist_ok=True)
+        df.to_pickle(os.path.join(DRIVE_CACHE_DIR, f"{file_id}.pkl"))
+        with open(os.path.join(DRIVE_CACHE_DIR, f"{file_id}.json"), 'w') as f:
+            json.dump({'cache_key': cache_key}, f)
+    except Exception as e:
+        print(f"   ⚠️  Could not cache file locally: {e}")
+
+def clear_cached_drive_files():
+    """Delete the local copies of Drive files (and their cache_key sidecars) saved by save_cached_drive_file"""
+    try:
+        names = os.listdir(DRIVE_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith('.pkl'):
+            file_id = name[:-len('.pkl')]
+            for path in (os.path.join(DRIVE_CACHE_DIR, name), os.path.join(DRIVE_CACHE_DIR, f"{file_id}.json")):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def start_connection_tests():
+    """Start the Gmail and Google Drive connection tests concurrently
+    Returns (gmail_future, drive_future); each result is the test's (success, message) tuple."""
+    from concurrent.futures import ThreadPoolExecutor
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+    
+    # Worker threads get this run's script context so the st.cache_* wrappers work in them
+    executor = ThreadPoolExecutor(max_workers=2, initializer=add_script_run_ctx, initargs=(None, get_script_run_ctx()))
+    gmail_future = executor.submit(test_gmail_connection)
+    drive_future = executor.submit(test_google_drive_connection)
+    executor.shutdown(wait=False)
+    return gmail_future, drive_future
+
+def read_file_from_drive_fixed(file_id, drive_uploader):
     """
     Read a file from Google Drive, handling both Google Sheets and Excel files
     This is a fixed version that works with both file types
@@ -160,7 +396,6 @@ def read_file_from_drive_fixed(file_id, drive_uploader, temp_filename='temp_driv
     Args:
         file_id: Google Drive file ID
         drive_uploader: GoogleDriveUploader instance
-        temp_filename: Temporary filename to save the file
     
     Returns:
         pandas DataFrame or None if error
@@ -173,7 +408,7 @@ def read_file_from_drive_fixed(file_id, drive_uploader, temp_filename='temp_driv
         # First, get file metadata to check the file type
         file_metadata = drive_uploader.service.files().get(
             fileId=file_id,
-            fields='id,name,mimeType'
+            fields='id,name,mimeType,modifiedTime,md5Checksum'
         ).execute()
         
         mime_type = file_metadata.get('mimeType', '')
@@ -182,6 +417,14 @@ def read_file_from_drive_fixed(file_id, drive_uploader, temp_filename='temp_driv
         print(f"📄 File: {file_name}")
         print(f"📋 MIME Type: {mime_type}")
         
+        # Skip the download when the file has not changed since it was last read
+        cache_key = f"{file_metadata.get('modifiedTime', '')}|{file_metadata.get('md5Checksum', '')}"
+        if file_metadata.get('modifiedTime'):
+            df = load_cached_drive_file(file_id, cache_key)
+            if df is not None:
+                print(f"   ♻️  File unchanged since {file_metadata['modifiedTime']} - using local copy ({len(df)} rows)")
+                return df
+        
         # Check if it's a Google Sheets file
         if mime_type == 'application/vnd.google-apps.spreadsheet':
             # It's a Google Sheets file - use export_media
@@ -195,18 +438,26 @@ def read_file_from_drive_fixed(file_id, drive_uploader, temp_filename='temp_driv
             print("   📄 Detected Excel/other file - using get_media")
             request = drive_uploader.service.files().get_media(fileId=file_id)
         
-        # Download to temporary file
+        # Download into memory in chunks - no temp file to write, re-read and clean up
         print(f"   📥 Downloading file...")
-        with open(temp_filename, 'wb') as f:
-            f.write(request.execute())
+        from googleapiclient.http import MediaIoBaseDownload
+        file_buffer = io.BytesIO()
+        downloader = MediaIoBaseDownload(file_buffer, request, chunksize=4 * 1024 * 1024)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+        file_buffer.seek(0)
         
         print(f"   ✅ Downloaded file successfully")
         
-        # Read Excel file with pandas
-        df = pd.read_excel(temp_filename, engine='openpyxl', header=0)
+        # Read Excel file with pandas (calamine: Rust-native reader, much faster than openpyxl)
+        df = pd.read_excel(file_buffer, engine='calamine', header=0)
         print(f"   ✅ Read {len(df)} rows from file")
         print(f"   📋 Columns: {list(df.columns)}")
         
+        if file_metadata.get('modifiedTime'):
+            save_cached_drive_file(file_id, cache_key, df)
+        
         return df
         
     except Exception as e:
@@ -236,15 +487,12 @@ def read_invoice_master_sheet_fixed(drive_uploader, file_id):
         print(f"   File ID: {file_id}")
         
         # Use the helper function to read the file
-        df = read_file_from_drive_fixed(file_id, drive_uploader, 'temp_invoice_master.xlsx')
+        df = read_file_from_drive_fixed(file_id, drive_uploader)
         
         if df is None or df.empty:
             print("   ⚠️  No data found in file")
             return None
         
-        # Extract matching fields from the sheet
-        extracted_data_list = []
-        
         # Find column mappings
         booking_code_col = None
         guest_name_col = None
@@ -269,39 +517,33 @@ def read_invoice_master_sheet_fixed(drive_uploader, file_id):
         print(f"      Check-In Date: {checkin_col}")
         print(f"      Check-Out Date: {checkout_col}")
         
-        # Extract data from each row
-        for idx, row in df.iterrows():
-            # Skip empty rows
-            if pd.isna(row.get(booking_code_col if booking_code_col else '')) and \
-               pd.isna(row.get(guest_name_col if guest_name_col else '')):
-                continue
-            
-            entry = {
-                'Booking Code': str(row[booking_code_col]).strip() if booking_code_col and not pd.isna(row.get(booking_code_col)) else '',
-                'Guest Name': str(row[guest_name_col]).strip() if guest_name_col and not pd.isna(row.get(guest_name_col)) else '',
-                'Check-In Date': str(row[checkin_col]).strip() if checkin_col and not pd.isna(row.get(checkin_col)) else '',
-                'Check-Out Date': str(row[checkout_col]).strip() if checkout_col and not pd.isna(row.get(checkout_col)) else ''
-            }
-            
-            # Clean up "Not Found" and "nan" values
-            for key, value in entry.items():
-                if value.lower() in ['not found', 'nan', 'none', '']:
-                    entry[key] = ''
-            
-            # Only add if we have at least one field
-            if any(entry.values()):
-                extracted_data_list.append(entry)
+        def clean_column(col):
+            """Stripped text of a column, '' for missing cells and "Not Found"/"nan"/"none" values"""
+            if not col:
+                return pd.Series('', index=df.index)
+            values = df[col]
+            # via object so datetime cells keep str(Timestamp) formatting
+            text = values.astype(object).astype(str).str.strip().mask(values.isna(), '')
+            return text.mask(text.str.lower().isin(['not found', 'nan', 'none', '']), '')
         
-        print(f"   ✅ Extracted {len(extracted_data_list)} entries from Invoice Master Sheet")
+        # Extract all rows at once
+        entries = pd.DataFrame({
+            'Booking Code': clean_column(booking_code_col),
+            'Guest Name': clean_column(guest_name_col),
+            'Check-In Date': clean_column(checkin_col),
+            'Check-Out Date': clean_column(checkout_col),
+        })
         
-        # Clean up temp file
-        try:
-            import time
-            time.sleep(0.3)
-            if os.path.exists('temp_invoice_master.xlsx'):
-                os.remove('temp_invoice_master.xlsx')
-        except:
-            pass
+        # Skip rows with neither a Booking Code nor a Guest Name cell, and rows with no field left
+        has_key_cell = pd.Series(False, index=df.index)
+        for col in (booking_code_col, guest_name_col):
+            if col:
+                has_key_cell |= df[col].notna()
+        entries = entries[has_key_cell & entries.ne('').any(axis=1)]
+        
+        extracted_data_list = entries.to_dict('records')
+        
+        print(f"   ✅ Extracted {len(extracted_data_list)} entries from Invoice Master Sheet")
         
         return extracted_data_list
         
@@ -311,21 +553,72 @@ def read_invoice_master_sheet_fixed(drive_uploader, file_id):
         traceback.print_exc()
         return None
 
+@functools.lru_cache(maxsize=4096, typed=True)
+def normalize_date_for_match(date_str):
+    """Normalize date string for comparison (memoized - master sheet dates repeat across entries)"""
+    if pd.isna(date_str) or not date_str:
+        return '', ''
+    
+    if hasattr(date_str, 'strftime'):
+        try:
+            format1 = date_str.strftime('%d-%b-%Y').lower()
+            format2 = date_str.strftime('%d/%m/%Y').lower()
+            return format1, format2
+        except:
+            date_str_lower = str(date_str).lower()
+            return date_str_lower, date_str_lower
+    
+    date_str = str(date_str).strip().lower()
+    format1 = date_str.replace('/', '-').replace(' ', '-').replace('.', '-')
+    format2 = date_str
+    return format1, format2
+
+def normalize_date_series(series):
+    """normalize_date_for_match over a whole Excel column at once
+    Returns (format1, format2, clean) Series - clean is format1 without separators, for the substring fallback."""
+    text = series.astype(str).str.strip().str.lower()
+    format1 = text.str.replace(r'[/ .]', '-', regex=True)
+    format2 = text
+    
+    # Real date cells (datetime column or datetime objects in an object column) use the strftime formats
+    if pd.api.types.is_datetime64_any_dtype(series):
+        is_date = series.notna()
+    else:
+        is_date = series.map(lambda value: hasattr(value, 'strftime') and not pd.isna(value))
+    if is_date.any():
+        dates = pd.to_datetime(series[is_date], errors='coerce')
+        format1 = format1.mask(is_date, dates.dt.strftime('%d-%b-%Y').str.lower())
+        format2 = format2.mask(is_date, dates.dt.strftime('%d/%m/%Y').str.lower())
+    
+    # Everything the scalar version treats as falsy (None/NaN/NaT, '', 0, 0.0, False) never matches
+    blank = series.map(lambda value: pd.isna(value) or not value).astype(bool)
+    format1 = format1.mask(blank, '')
+    return format1, format2.mask(blank, ''), format1.str.replace(r'[-/ ]', '', regex=True)
+
+def match_date_series(excel_format1, excel_format2, excel_clean, date_value):
+    """Vectorized date condition for one extracted date against normalized Excel date columns"""
+    date_norm, date_norm2 = normalize_date_for_match(date_value)
+    condition = (excel_format1.eq(date_norm) | excel_format1.eq(date_norm2) |
+                 excel_format2.eq(date_norm) | excel_format2.eq(date_norm2))
+    
+    if date_norm:
+        # Fallback: digits/letters only, either value contained in the other
+        date_clean = re.sub(r'[-/ ]', '', date_norm)
+        date_substrings = {date_clean[i:j] for i in range(len(date_clean) + 1) for j in range(i, len(date_clean) + 1)}
+        condition |= excel_format1.ne('') & (
+            excel_clean.str.contains(date_clean, regex=False) | excel_clean.isin(date_substrings)
+        )
+    
+    return condition
+
 def match_master_sheet_with_excel_fixed():
     """
     Fixed version of match_master_sheet_with_excel that correctly handles Excel files
     """
-    from google_drive_uploader import GoogleDriveUploader
-    
-    # Initialize Google Drive uploader
-    drive_uploader = None
+    # Initialize Google Drive uploader (authenticated once, then reused)
     try:
-        drive_uploader = GoogleDriveUploader()
-        if drive_uploader.authenticate():
-            print("✅ Google Drive initialized successfully")
-        else:
-            print("❌ Google Drive authentication failed")
-            return 0
+        drive_uploader = get_drive_uploader()
+        print("✅ Google Drive initialized successfully")
     except Exception as e:
         print(f"❌ Google Drive setup failed: {e}")
         return 0
@@ -336,26 +629,40 @@ def match_master_sheet_with_excel_fixed():
         print("⚠️  No data extracted from Invoice Master Sheet - skipping matching")
         return 0
     
-    # Read local Excel file
-    df = read_matching_excel_file()
+    # Read local Excel file (parsed once per file version, then copied - the cached frame is shared)
+    try:
+        excel_mtime = os.stat(MATCHING_EXCEL_FILE_PATH).st_mtime_ns
+    except OSError:
+        excel_mtime = None
+    df = get_matching_dataframe(excel_mtime)
     if df is None or df.empty:
+        get_matching_dataframe.clear()
         print("⚠️  Excel file is empty or invalid - skipping matching")
         return 0
+    df = df.copy()
     
     print(f"\n🔍 Matching Invoice Master Sheet data with local Excel file...")
     print(f"🔍 Excel file has {len(df)} rows and {len(df.columns)} columns")
     print(f"🔍 Excel columns: {list(df.columns)}")
     print(f"🔍 Extracted {len(extracted_data_list)} entries from Invoice Master Sheet")
     
-    # Create a mapping of field names to Excel columns
-    field_to_column = {}
-    for field in MATCHING_FIELDS:
-        column = find_matching_column(df, field)
-        if column:
-            field_to_column[field] = column
+    # Create a mapping of field names to Excel columns - reused from this session while the file is unchanged
+    cached_mapping = st.session_state.get('field_to_column_mapping')
+    if cached_mapping and cached_mapping['mtime'] == excel_mtime:
+        field_to_column = cached_mapping['mapping']
+        print(f"♻️  Excel file unchanged - reusing column mapping")
+        for field, column in field_to_column.items():
             print(f"✅ Mapped '{field}' → '{column}'")
-        else:
-            print(f"⚠️  No matching column found for '{field}'")
+    else:
+        field_to_column = {}
+        for field in MATCHING_FIELDS:
+            column = find_matching_column(df, field)
+            if column:
+                field_to_column[field] = column
+                print(f"✅ Mapped '{field}' → '{column}'")
+            else:
+                print(f"⚠️  No matching column found for '{field}'")
+        st.session_state.field_to_column_mapping = {'mtime': excel_mtime, 'mapping': field_to_column}
     
     if not field_to_column:
         print("❌ No matching columns found. Cannot match Excel rows.")
@@ -371,6 +678,41 @@ def match_master_sheet_with_excel_fixed():
     rows_updated = 0
     rows_skipped = 0
     
+    # Rows already marked before this run, and the rows this run will mark (written in one go at the end)
+    # Plain NumPy arrays - df comes straight from read_excel, so row labels are positions
+    already_received = (df[INVOICE_RECEIVED_COLUMN].astype(str).str.strip().str.lower() == INVOICE_RECEIVED_VALUE.lower()).to_numpy()
+    rows_to_update = set()
+    
+    # Column shown in the per-row update log
+    log_field = None
+    if 'Booking Code' in field_to_column:
+        log_field = 'Booking Code'
+    elif 'Guest Name' in field_to_column:
+        log_field = 'Guest Name'
+    log_values = df[field_to_column[log_field]].astype(str).to_numpy() if log_field else None
+    
+    # Index Booking Codes once (lowercased code -> row indices) so each entry is a dict lookup
+    booking_code_index = {}
+    if 'Booking Code' in field_to_column:
+        booking_codes = df[field_to_column['Booking Code']].astype(str).str.strip().str.lower()
+        for row_idx, code in booking_codes.items():
+            booking_code_index.setdefault(code, []).append(row_idx)
+    
+    # Normalize the Excel columns used by Step 2 once, instead of per cell for every entry
+    guest_lower = date_keys = None
+    guest_index = {}
+    if all(f in field_to_column for f in ['Guest Name', 'Check-In Date', 'Check-Out Date']):
+        guest_lower = df[field_to_column['Guest Name']].astype(str).str.strip().str.lower()
+        for row_idx, guest in guest_lower.items():
+            guest_index.setdefault(guest, []).append(row_idx)
+        # All per-row date keys in one frame, so each entry slices its candidate rows once
+        checkin_formats = normalize_date_series(df[field_to_column['Check-In Date']])
+        checkout_formats = normalize_date_series(df[field_to_column['Check-Out Date']])
+        date_keys = pd.DataFrame({
+            'checkin_1': checkin_formats[0], 'checkin_2': checkin_formats[1], 'checkin_clean': checkin_formats[2],
+            'checkout_1': checkout_formats[0], 'checkout_2': checkout_formats[1], 'checkout_clean': checkout_formats[2],
+        })
+    
     # Process each extracted data entry (same logic as original function)
     for idx, entry in enumerate(extracted_data_list):
         if not entry or not any(entry.values()):
@@ -385,22 +727,17 @@ def match_master_sheet_with_excel_fixed():
         
         # Step 1: Try matching by Booking Code first (Primary Key)
         if 'Booking Code' in field_to_column:
-            booking_code_column = field_to_column['Booking Code']
             booking_code_value = entry.get('Booking Code', '').strip()
             
             if booking_code_value:
                 print(f"   🔍 Step 1: Matching by Booking Code: '{booking_code_value}'")
-                try:
-                    # Case-insensitive matching
-                    mask = df[booking_code_column].astype(str).str.strip().str.lower() == booking_code_value.lower()
-                    matching_row_indices = df[mask].index.tolist()
-                    
-                    if matching_row_indices:
-                        print(f"   ✅ Found {len(matching_row_indices)} row(s) with Booking Code: '{booking_code_value}'")
-                    else:
-                        print(f"   ⚠️  No row found with Booking Code: '{booking_code_value}'")
-                except Exception as e:
-                    print(f"   ❌ Error matching by Booking Code: {e}")
+                # Case-insensitive matching
+                matching_row_indices = booking_code_index.get(booking_code_value.lower(), [])
+                
+                if matching_row_indices:
+                    print(f"   ✅ Found {len(matching_row_indices)} row(s) with Booking Code: '{booking_code_value}'")
+                else:
+                    print(f"   ⚠️  No row found with Booking Code: '{booking_code_value}'")
         
         # Step 2: If no Booking Code match, try matching by Guest Name + Check-In Date + Check-Out Date
         if not matching_row_indices:
@@ -429,86 +766,24 @@ def match_master_sheet_with_excel_fixed():
             print(f"      Check-Out Date: '{checkout_value}'")
             
             try:
-                guest_col = field_to_column['Guest Name']
-                checkin_col = field_to_column['Check-In Date']
-                checkout_col = field_to_column['Check-Out Date']
+                # Case-insensitive matching for guest name - exact via the index, else substring
+                candidate_rows = guest_index.get(guest_name_value.lower())
+                if candidate_rows is None:
+                    condition1 = guest_lower.str.contains(guest_name_value.lower(), na=False, regex=False)
+                    candidate_rows = condition1[condition1].index.tolist()
                 
-                # Normalize date formats for matching (same logic as original)
-                def normalize_date_for_match(date_str):
-                    """Normalize date string for comparison"""
-                    if pd.isna(date_str) or not date_str:
-                        return '', ''
+                # Date matching - check-in and check-out, only on rows whose guest name matched
+                matching_row_indices = []
+                if candidate_rows:
+                    candidate_keys = date_keys.loc[candidate_rows]
+                    condition2 = match_date_series(candidate_keys['checkin_1'], candidate_keys['checkin_2'],
+                                                   candidate_keys['checkin_clean'], checkin_value)
+                    condition3 = match_date_series(candidate_keys['checkout_1'], candidate_keys['checkout_2'],
+                                                   candidate_keys['checkout_clean'], checkout_value)
                     
-                    if hasattr(date_str, 'strftime'):
-                        try:
-                            format1 = date_str.strftime('%d-%b-%Y').lower()
-                            format2 = date_str.strftime('%d/%m/%Y').lower()
-                            return format1, format2
-                        except:
-                            date_str_lower = str(date_str).lower()
-                            return date_str_lower, date_str_lower
-                    
-                    date_str = str(date_str).strip().lower()
-                    format1 = date_str.replace('/', '-').replace(' ', '-').replace('.', '-')
-                    format2 = date_str
-                    return format1, format2
-                
-                # Normalize extracted dates
-                checkin_norm, checkin_norm2 = normalize_date_for_match(checkin_value)
-                checkout_norm, checkout_norm2 = normalize_date_for_match(checkout_value)
-                
-                # Case-insensitive matching for guest name
-                condition1 = df[guest_col].astype(str).str.strip().str.lower() == guest_name_value.lower()
-                if not condition1.any():
-                    condition1 = df[guest_col].astype(str).str.strip().str.lower().str.contains(
-                        guest_name_value.lower(), na=False, regex=False
-                    )
-                
-                # Date matching - check-in
-                condition2_list = []
-                for row_idx in df.index:
-                    excel_checkin = df.at[row_idx, checkin_col]
-                    excel_checkin_norm, excel_checkin_norm2 = normalize_date_for_match(excel_checkin)
-                    
-                    if (checkin_norm == excel_checkin_norm or checkin_norm == excel_checkin_norm2 or
-                        checkin_norm2 == excel_checkin_norm or checkin_norm2 == excel_checkin_norm2):
-                        condition2_list.append(True)
-                    elif checkin_norm and excel_checkin_norm:
-                        checkin_clean = checkin_norm.replace('-', '').replace('/', '').replace(' ', '')
-                        excel_clean = excel_checkin_norm.replace('-', '').replace('/', '').replace(' ', '')
-                        if checkin_clean in excel_clean or excel_clean in checkin_clean:
-                            condition2_list.append(True)
-                        else:
-                            condition2_list.append(False)
-                    else:
-                        condition2_list.append(False)
-                
-                condition2 = pd.Series(condition2_list, index=df.index)
-                
-                # Date matching - check-out
-                condition3_list = []
-                for row_idx in df.index:
-                    excel_checkout = df.at[row_idx, checkout_col]
-                    excel_checkout_norm, excel_checkout_norm2 = normalize_date_for_match(excel_checkout)
-                    
-                    if (checkout_norm == excel_checkout_norm or checkout_norm == excel_checkout_norm2 or
-                        checkout_norm2 == excel_checkout_norm or checkout_norm2 == excel_checkout_norm2):
-                        condition3_list.append(True)
-                    elif checkout_norm and excel_checkout_norm:
-                        checkout_clean = checkout_norm.replace('-', '').replace('/', '').replace(' ', '')
-                        excel_clean = excel_checkout_norm.replace('-', '').replace('/', '').replace(' ', '')
-                        if checkout_clean in excel_clean or excel_clean in checkout_clean:
-                            condition3_list.append(True)
-                        else:
-                            condition3_list.append(False)
-                    else:
-                        condition3_list.append(False)
-                
-                condition3 = pd.Series(condition3_list, index=df.index)
-                
-                # All three must match
-                combined_condition = condition1 & condition2 & condition3
-                matching_row_indices = df[combined_condition].index.tolist()
+                    # All three must match
+                    combined_condition = condition2 & condition3
+                    matching_row_indices = combined_condition[combined_condition].index.tolist()
                 
                 if matching_row_indices:
                     print(f"   ✅ Found {len(matching_row_indices)} row(s) matching all three fields")
@@ -518,37 +793,27 @@ def match_master_sheet_with_excel_fixed():
                 print(f"   ❌ Error matching by three fields: {e}")
                 continue
         
-        # Update matching rows
+        # Collect matching rows
         if matching_row_indices:
             for row_idx in matching_row_indices:
-                try:
-                    # Check if already marked as "Received"
-                    current_value = str(df.at[row_idx, INVOICE_RECEIVED_COLUMN]).strip()
-                    if current_value.lower() == INVOICE_RECEIVED_VALUE.lower():
-                        print(f"   ⏭️  Row {row_idx + 1} already marked as '{INVOICE_RECEIVED_VALUE}', skipping")
-                        rows_skipped += 1
-                        continue
-                    
-                    # Update the Invoice Received column
-                    df.at[row_idx, INVOICE_RECEIVED_COLUMN] = INVOICE_RECEIVED_VALUE
-                    rows_updated += 1
-                    
-                    log_info = ""
-                    if 'Booking Code' in field_to_column:
-                        bc_val = str(df.at[row_idx, field_to_column['Booking Code']])
-                        log_info = f"Booking Code: '{bc_val}'"
-                    elif 'Guest Name' in field_to_column:
-                        gn_val = str(df.at[row_idx, field_to_column['Guest Name']])
-                        log_info = f"Guest Name: '{gn_val}'"
-                    
-                    print(f"   ✅ Updated row {row_idx + 1} - {log_info} → '{INVOICE_RECEIVED_VALUE}'")
-                    
-                except Exception as e:
-                    print(f"   ❌ Error updating row {row_idx + 1}: {e}")
+                # Check if already marked as "Received" (before or earlier in this run)
+                if already_received[row_idx] or row_idx in rows_to_update:
+                    print(f"   ⏭️  Row {row_idx + 1} already marked as '{INVOICE_RECEIVED_VALUE}', skipping")
+                    rows_skipped += 1
                     continue
+                
+                rows_to_update.add(row_idx)
+                rows_updated += 1
+                
+                log_info = f"{log_field}: '{log_values[row_idx]}'" if log_field else ""
+                print(f"   ✅ Updated row {row_idx + 1} - {log_info} → '{INVOICE_RECEIVED_VALUE}'")
         else:
             print(f"   ❌ No matching row found for this entry")
     
+    # Update the Invoice Received column for all matched rows at once
+    if rows_to_update:
+        df.loc[sorted(rows_to_update), INVOICE_RECEIVED_COLUMN] = INVOICE_RECEIVED_VALUE
+    
     print(f"\n📊 Matching Summary:")
     print(f"   ✅ Rows updated: {rows_updated}")
     print(f"   ⏭️  Rows skipped (already marked): {rows_skipped}")
@@ -569,47 +834,53 @@ def match_master_sheet_with_excel_fixed():
                 print(f"   💡 The file will be saved when you close Excel and run the function again.")
                 return rows_updated
             
-            from openpyxl import load_workbook
             from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
             
-            # Save DataFrame to Excel
-            print(f"   💾 Writing DataFrame to Excel...")
-            df.to_excel(MATCHING_EXCEL_FILE_PATH, index=False, engine='openpyxl')
-            print(f"   ✅ DataFrame saved successfully")
-            
-            # Load with openpyxl to apply formatting
-            wb = load_workbook(MATCHING_EXCEL_FILE_PATH)
-            ws = wb.active
-            
-            # Apply header formatting
+            # Header formatting
             header_font = Font(bold=True, color="FFFFFF", size=11)
             header_fill = PatternFill(start_color="2F5597", end_color="2F5597", fill_type="solid")
             header_alignment = Alignment(horizontal="center", vertical="center", wrap_text=True)
             
-            for cell in ws[1]:
-                cell.font = header_font
-                cell.fill = header_fill
-                cell.alignment = header_alignment
-            
-            # Add borders
+            # Borders - built once and shared by every cell
             thin_border = Border(
                 left=Side(style='thin'),
                 right=Side(style='thin'),
                 top=Side(style='thin'),
                 bottom=Side(style='thin')
             )
+            body_alignment = Alignment(horizontal="left", vertical="center", wrap_text=True)
             
-            for row in ws.iter_rows():
-                for cell in row:
-                    cell.border = thin_border
-                    if cell.row > 1:
-                        cell.alignment = Alignment(horizontal="left", vertical="center", wrap_text=True)
+            # Stream styled rows into a write-only workbook - rows are not kept in memory, one save
+            print(f"   💾 Writing DataFrame to Excel...")
+            from openpyxl import Workbook
+            from openpyxl.cell import WriteOnlyCell
+            
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet('Sheet1')
             
             # Freeze header row
             ws.freeze_panes = "A2"
             
+            header_cells = []
+            for column_name in df.columns:
+                cell = WriteOnlyCell(ws, value=str(column_name))
+                cell.font = header_font
+                cell.fill = header_fill
+                cell.alignment = header_alignment
+                cell.border = thin_border
+                header_cells.append(cell)
+            ws.append(header_cells)
+            
+            for row in df.itertuples(index=False, name=None):
+                row_cells = []
+                for value in row:
+                    cell = WriteOnlyCell(ws, value=None if pd.isna(value) else value)
+                    cell.border = thin_border
+                    cell.alignment = body_alignment
+                    row_cells.append(cell)
+                ws.append(row_cells)
+            
             wb.save(MATCHING_EXCEL_FILE_PATH)
-            wb.close()
             
             print(f"✅ Saved updated Excel file: {MATCHING_EXCEL_FILE_PATH}")
             print(f"   📊 Total rows in saved file: {len(df)}")
@@ -661,6 +932,7 @@ def sidebar():
     st.sidebar.subheader("Quick Actions")
     
     if st.sidebar.button("🔄 Test Gmail Connection"):
+        test_gmail_connection.clear()
         success, message = test_gmail_connection()
         if success:
             st.sidebar.success(message)
@@ -668,6 +940,8 @@ def sidebar():
             st.sidebar.error(message)
     
     if st.sidebar.button("🔄 Test Google Drive Connection"):
+        test_google_drive_connection.clear()
+        get_drive_uploader.clear()
         success, message = test_google_drive_connection()
         if success:
             st.sidebar.success(message)
@@ -676,7 +950,8 @@ def sidebar():
     
     if st.sidebar.button("🔄 Refresh Vendor Reference"):
         try:
-            vendor_ref = load_vendor_reference()
+            get_vendor_reference.clear()
+            vendor_ref = get_vendor_reference()
             st.session_state.vendor_reference = vendor_ref
             st.sidebar.success(f"✅ Loaded {len(vendor_ref)} vendor references")
         except Exception as e:
@@ -694,6 +969,80 @@ def sidebar():
     else:
         st.sidebar.error("❌ Missing required configuration")
 
+@st.fragment
+def vendor_reference_fragment():
+    """Dashboard vendor reference block - its button reruns only this fragment, not the whole page"""
+    st.subheader("Vendor Reference")
+    
+    if st.button("🔄 Load Vendor Reference"):
+        try:
+            get_vendor_reference.clear()
+            vendor_ref = get_vendor_reference()
+            st.session_state.vendor_reference = vendor_ref
+            
+            # Display vendor reference
+            vendor_data = []
+            columns = ['SANDHYA', 'MOKSHITHA', 'KUMAR', 'LAKSHMI']
+            
+            for vendor_name, column in vendor_ref.items():
+                vendor_data.append({
+                    'Vendor Name': vendor_name,
+                    'Assigned To': column
+                })
+            
+            if vendor_data:
+                vendor_df = pd.DataFrame(vendor_data)
+                st.dataframe(vendor_df, use_container_width=True, hide_index=True)
+                st.success(f"✅ Loaded {len(vendor_ref)} vendor references")
+            else:
+                st.warning("⚠️ No vendor references found")
+        except Exception as e:
+            st.error(f"❌ Error loading vendor reference: {e}")
+    
+    if st.session_state.vendor_reference:
+        st.info(f"📋 {len(st.session_state.vendor_reference)} vendor references loaded in session")
+
+@st.fragment
+def test_connections_fragment():
+    """Connection test buttons - clicking one reruns only this fragment, not the whole page"""
+    st.subheader("Test Connections")
+    
+    # Both tests at once - waits for the slower one instead of the two back to back
+    if st.button("🧪 Test All Connections", use_container_width=True):
+        with st.spinner("Testing Gmail and Google Drive connections..."):
+            test_gmail_connection.clear()
+            test_google_drive_connection.clear()
+            get_drive_uploader.clear()
+            gmail_future, drive_future = start_connection_tests()
+            for success, message in (gmail_future.result(), drive_future.result()):
+                if success:
+                    st.success(message)
+                else:
+                    st.error(message)
+    
+    test_col1, test_col2 = st.columns(2)
+    
+    with test_col1:
+        if st.button("🧪 Test Gmail Connection", use_container_width=True):
+            with st.spinner("Testing Gmail connection..."):
+                test_gmail_connection.clear()
+                success, message = test_gmail_connection()
+                if success:
+                    st.success(message)
+                else:
+                    st.error(message)
+    
+    with test_col2:
+        if st.button("🧪 Test Google Drive Connection", use_container_width=True):
+            with st.spinner("Testing Google Drive connection..."):
+                test_google_drive_connection.clear()
+                get_drive_uploader.clear()
+                success, message = test_google_drive_connection()
+                if success:
+                    st.success(message)
+                else:
+                    st.error(message)
+
 def dashboard_tab():
     """Dashboard tab showing system status and overview"""
     st.header("📊 Dashboard")
@@ -703,10 +1052,13 @@ def dashboard_tab():
     
     col1, col2, col3, col4 = st.columns(4)
     
+    # Both probes are network-bound - run them together so the dashboard waits for the slower one only
+    gmail_future, drive_future = start_connection_tests()
+    
     # Gmail Status
     with col1:
         try:
-            gmail_status, gmail_msg = test_gmail_connection()
+            gmail_status, gmail_msg = gmail_future.result()
             if gmail_status:
                 st.success("📧 Gmail: Connected")
             else:
@@ -717,7 +1069,7 @@ def dashboard_tab():
     # Google Drive Status
     with col2:
         try:
-            drive_status, drive_msg = test_google_drive_connection()
+            drive_status, drive_msg = drive_future.result()
             if drive_status:
                 st.success("☁️ Google Drive: Connected")
             else:
@@ -727,17 +1079,16 @@ def dashboard_tab():
     
     # AWS Bedrock Status
     with col3:
-        bedrock_enabled = os.getenv('ENABLE_OPENAI_VISION', 'false').lower() == 'true'
-        if bedrock_enabled:
-            model = os.getenv('AWS_BEDROCK_MODEL', 'Not set')
-            st.success(f"🤖 AWS Bedrock: Enabled ({model})")
+        env = app_env()
+        if env.bedrock_enabled:
+            st.success(f"🤖 AWS Bedrock: Enabled ({env.bedrock_model})")
         else:
             st.warning("🤖 AWS Bedrock: Disabled")
     
     # Vendor Reference Status
     with col4:
         try:
-            vendor_ref = load_vendor_reference()
+            vendor_ref = get_vendor_reference()
             st.success(f"📋 Vendors: {len(vendor_ref)} loaded")
         except:
             st.error("📋 Vendors: Not loaded")
@@ -753,51 +1104,22 @@ def dashboard_tab():
     
     with config_col1:
         st.write("**Required Configuration:**")
-        config_df = pd.DataFrame([
-            {"Setting": k, "Value": "✅ Set" if v else "❌ Missing"}
-            for k, v in required_vars.items()
-        ])
+        config_df = get_config_table(tuple(
+            (k, "✅ Set" if v else "❌ Missing") for k, v in required_vars.items()
+        ))
         st.dataframe(config_df, use_container_width=True, hide_index=True)
     
     with config_col2:
         st.write("**Optional Configuration:**")
-        optional_df = pd.DataFrame([
-            {"Setting": k, "Value": v if v else "Not set"}
-            for k, v in optional_vars.items()
-        ])
+        optional_df = get_config_table(tuple(
+            (k, v if v else "Not set") for k, v in optional_vars.items()
+        ))
         st.dataframe(optional_df, use_container_width=True, hide_index=True)
     
     st.divider()
     
     # Vendor Reference
-    st.subheader("Vendor Reference")
-    
-    if st.button("🔄 Load Vendor Reference"):
-        try:
-            vendor_ref = load_vendor_reference()
-            st.session_state.vendor_reference = vendor_ref
-            
-            # Display vendor reference
-            vendor_data = []
-            columns = ['SANDHYA', 'MOKSHITHA', 'KUMAR', 'LAKSHMI']
-            
-            for vendor_name, column in vendor_ref.items():
-                vendor_data.append({
-                    'Vendor Name': vendor_name,
-                    'Assigned To': column
-                })
-            
-            if vendor_data:
-                vendor_df = pd.DataFrame(vendor_data)
-                st.dataframe(vendor_df, use_container_width=True, hide_index=True)
-                st.success(f"✅ Loaded {len(vendor_ref)} vendor references")
-            else:
-                st.warning("⚠️ No vendor references found")
-        except Exception as e:
-            st.error(f"❌ Error loading vendor reference: {e}")
-    
-    if st.session_state.vendor_reference:
-        st.info(f"📋 {len(st.session_state.vendor_reference)} vendor references loaded in session")
+    vendor_reference_fragment()
     
     st.divider()
     
@@ -806,6 +1128,16 @@ def dashboard_tab():
     
     if st.session_state.last_processed:
         st.info(f"📅 Last processed: {st.session_state.last_processed}")
+    
+    st.divider()
+    
+    # Cache
+    if st.button("🧹 Clear Cache"):
+        st.cache_data.clear()
+        # Also drops the env snapshot, cached Excel data, IMAP connection (logged out) and Drive uploader
+        st.cache_resource.clear()
+        clear_cached_drive_files()
+        st.success("✅ Cached data cleared")
 
 def process_invoices_tab():
     """Tab for processing invoices"""
@@ -816,6 +1148,7 @@ def process_invoices_tab():
     # Configuration
     st.subheader("Processing Configuration")
     
+    env = app_env()
     col1, col2 = st.columns(2)
     
     with col1:
@@ -829,9 +1162,9 @@ def process_invoices_tab():
     
     with col2:
         st.write("**Current Settings:**")
-        st.info(f"📧 Gmail: {os.getenv('GMAIL_EMAIL', 'Not set')}")
-        st.info(f"☁️ Drive Upload: {'Enabled' if os.getenv('ENABLE_GOOGLE_DRIVE_UPLOAD', 'false').lower() == 'true' else 'Disabled'}")
-        st.info(f"🤖 AWS Bedrock: {'Enabled' if os.getenv('ENABLE_OPENAI_VISION', 'false').lower() == 'true' else 'Disabled'}")
+        st.info(f"📧 Gmail: {env.gmail_email}")
+        st.info(f"☁️ Drive Upload: {'Enabled' if env.drive_enabled else 'Disabled'}")
+        st.info(f"🤖 AWS Bedrock: {'Enabled' if env.bedrock_enabled else 'Disabled'}")
     
     st.divider()
     
@@ -849,10 +1182,34 @@ def process_invoices_tab():
             st.info("🔄 Processing invoices... This may take a few minutes.")
             progress_bar = st.progress(0)
             status_text = st.empty()
+            with st.expander("📜 Processing log", expanded=False):
+                log_stream = TeeStream(st.empty())
         
         try:
-            # Capture output (but don't display it)
-            result, output = capture_output(process_invoices)
+            # Run the processor in a worker thread so the progress bar and the live log can be
+            # updated from here while it works (only the last lines of output are kept).
+            # It reuses the cached Bedrock client (boto3 clients are thread-safe); the Drive uploader
+            # is built per run inside process_invoices, as the Drive service cannot be shared
+            from concurrent.futures import ThreadPoolExecutor
+            progress = {'done': 0, 'total': 0}
+            
+            def report_progress(done, total):
+                progress['done'], progress['total'] = done, total
+            
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(
+                    capture_output, process_invoices,
+                    bedrock_client=get_bedrock_client(),
+                    progress_callback=report_progress, stream=log_stream
+                )
+                while not future.done():
+                    if progress['total']:
+                        progress_bar.progress(min(99, progress['done'] * 100 // progress['total']))
+                        status_text.text(f"📨 Processed {progress['done']}/{progress['total']} emails")
+                    log_stream.refresh()
+                    time.sleep(0.25)
+                result, output = future.result()
+            log_stream.refresh(force=True)
             
             # Update logs in session state (for internal use, not displayed)
             log_lines = output.split('\n')
@@ -868,6 +1225,12 @@ def process_invoices_tab():
             else:
                 status_text.success("✅ Processing completed successfully!")
             
+            by_folder = log_stream.uploads_by_folder
+            if by_folder:
+                st.write("**PDFs uploaded to Google Drive:** " + ", ".join(
+                    f"{folder}: {count}" for folder, count in sorted(by_folder.items())
+                ))
+            
             st.balloons()
             
         except Exception as e:
@@ -883,27 +1246,7 @@ def process_invoices_tab():
     
     # Connection testing
     st.divider()
-    st.subheader("Test Connections")
-    
-    test_col1, test_col2 = st.columns(2)
-    
-    with test_col1:
-        if st.button("🧪 Test Gmail Connection", use_container_width=True):
-            with st.spinner("Testing Gmail connection..."):
-                success, message = test_gmail_connection()
-                if success:
-                    st.success(message)
-                else:
-                    st.error(message)
-    
-    with test_col2:
-        if st.button("🧪 Test Google Drive Connection", use_container_width=True):
-            with st.spinner("Testing Google Drive connection..."):
-                success, message = test_google_drive_connection()
-                if success:
-                    st.success(message)
-                else:
-                    st.error(message)
+    test_connections_fragment()
 
 def match_invoices_tab():
     """Tab for matching invoices with Excel"""
@@ -943,12 +1286,14 @@ def statistics_tab():
     # Excel Statistics
     st.subheader("Excel File Statistics")
     
-    excel_path = os.getenv('EXCEL_FILE_PATH', MATCHING_EXCEL_FILE_PATH)
+    # Same path get_matching_dataframe reads, so the cache key and the cached file always agree
+    excel_path = MATCHING_EXCEL_FILE_PATH
     
     if st.button("🔄 Refresh Statistics"):
         if os.path.exists(excel_path):
             try:
-                df = read_matching_excel_file()
+                # Parsed once per file version; the cached frame is shared, so it is only read here
+                df = get_matching_dataframe(os.stat(excel_path).st_mtime_ns)
                 if df is not None and not df.empty:
                     # Display statistics
                     col1, col2, col3 = st.columns(3)
@@ -961,7 +1306,7 @@ def statistics_tab():
                     
                     with col3:
                         if 'Invoice Received' in df.columns:
-                            received_count = len(df[df['Invoice Received'].astype(str).str.strip().str.lower() == 'received'])
+                            received_count = int(df['Invoice Received'].astype('string').str.strip().str.lower().eq('received').sum())
                             st.metric("Invoices Received", received_count)
                         else:
                             st.metric("Invoices Received", "N/A")
@@ -972,8 +1317,8 @@ def statistics_tab():
                     st.subheader("Column Information")
                     columns_df = pd.DataFrame({
                         'Column Name': df.columns,
-                        'Data Type': [str(df[col].dtype) for col in df.columns],
-                        'Non-Null Count': [df[col].notna().sum() for col in df.columns]
+                        'Data Type': df.dtypes.astype(str).to_numpy(),
+                        'Non-Null Count': df.count().to_numpy()
                     })
                     st.dataframe(columns_df, use_container_width=True, hide_index=True)
                     
@@ -1006,18 +1351,12 @@ def statistics_tab():
     
     if st.button("🔄 Load Vendor Statistics"):
         try:
-            vendor_ref = load_vendor_reference()
+            vendor_ref = get_vendor_reference()
             
             if vendor_ref:
                 # Count by column
-                column_counts = {}
-                for vendor, column in vendor_ref.items():
-                    column_counts[column] = column_counts.get(column, 0) + 1
-                
-                stats_df = pd.DataFrame({
-                    'Assigned To': list(column_counts.keys()),
-                    'Vendor Count': list(column_counts.values())
-                })
+                column_counts = pd.Series(list(vendor_ref.values())).value_counts(sort=False)
+                stats_df = column_counts.rename_axis('Assigned To').reset_index(name='Vendor Count')
                 
                 st.dataframe(stats_df, use_container_width=True, hide_index=True)
                 st.bar_chart(stats_df.set_index('Assigned To'))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Check that the vectorized Excel date matching in streamlit_app agrees with
+matching each cell through normalize_date_for_match (the original per-row loop)
+"""
+
+import datetime
+import random
+
+import numpy as np
+import pandas as pd
+
+from streamlit_app import normalize_date_for_match, normalize_date_series, match_date_series
+
+CELL_VALUES = [
+    datetime.datetime(2025, 1, 5), datetime.date(2025, 1, 5), pd.Timestamp('2025-02-03'), pd.NaT,
+    '05-Jan-2025', '05/01/2025', ' 5 jan 2025 ', '2025.01.05', '03-feb-2025', 'x', '-', '', '   ',
+    None, float('nan'), 0, 0.0, False, True, 1, 5, 2025, 45000, 0.5, np.int64(0), np.float64(0.0)
+]
+EXTRACTED_DATES = [
+    '05-Jan-2025', '05/01/2025', '5 jan 2025', '03-feb-2025', 'jan', '2025', '0', '10', '01',
+    datetime.datetime(2025, 1, 5), pd.Timestamp('2025-02-03'), '', None
+]
+
+def match_cells_one_by_one(cells, date_value):
+    """Reference: the per-row comparison the vectorized version replaced"""
+    date_norm, date_norm2 = normalize_date_for_match(date_value)
+    matches = []
+    for cell in cells:
+        cell_norm, cell_norm2 = normalize_date_for_match(cell)
+        if date_norm in (cell_norm, cell_norm2) or date_norm2 in (cell_norm, cell_norm2):
+            matches.append(True)
+        elif date_norm and cell_norm:
+            date_clean = date_norm.replace('-', '').replace('/', '').replace(' ', '')
+            cell_clean = cell_norm.replace('-', '').replace('/', '').replace(' ', '')
+            matches.append(date_clean in cell_clean or cell_clean in date_clean)
+        else:
+            matches.append(False)
+    return matches
+
+def check_column(cells, series):
+    normalized = normalize_date_series(series)
+    for date_value in EXTRACTED_DATES:
+        expected = match_cells_one_by_one(cells, date_value)
+        assert list(match_date_series(*normalized, date_value)) == expected, (date_value, cells)
+
+def test_mixed_type_columns_match_like_the_scalar_path():
+    rng = random.Random(0)
+    for _ in range(200):
+        cells = [rng.choice(CELL_VALUES) for _ in range(rng.randint(1, 12))]
+        check_column(cells, pd.Series(cells, dtype=object))
+
+def test_falsy_cells_never_match():
+    cells = [0, 0.0, False, '', None, float('nan')]
+    for date_value in ['05-Jan-2025', '10', '0']:
+        assert not match_date_series(*normalize_date_series(pd.Series(cells, dtype=object)), date_value).any()
+
+def test_datetime_column_matches_like_the_scalar_path():
+    series = pd.Series(pd.to_datetime(['2025-01-05', None, '2025-02-03']))
+    check_column(list(series), series)
+
+if __name__ == "__main__":
+    test_mixed_type_columns_match_like_the_scalar_path()
+    test_falsy_cells_never_match()
+    test_datetime_column_matches_like_the_scalar_path()
+    print("[SUCCESS] Vectorized date matching agrees with the per-row comparison")
+
+def test_equal_scalars_of_different_types_are_normalized_separately():
+    normalize_date_for_match.cache_clear()
+    assert normalize_date_for_match(True) == ('true', 'true')
+    assert normalize_date_for_match(1.0) == normalize_date_for_match.__wrapped__(1.0)
+    assert normalize_date_for_match(1) == normalize_date_for_match.__wrapped__(1)
@@ -161,5 +161,9 @@ def main():
         print("\n⚠️  Some tests failed. Check the output above for details.")
 
 if __name__ == "__main__":
+    import sys
+    from openai_vision_extractor import show_status_messages
+    # Show the extractor's status messages alongside the test output
+    show_status_messages(sys.stdout)
     main()
 
@@ -5,117 +5,319 @@ Tests model initialization without requiring all dependencies
 """
 
 import os
+import sys
 import json
-import boto3
-from dotenv import load_dotenv
+import re
+import heapq
+import threading
+from dataclasses import dataclass
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from dotenv import dotenv_values
 
-# Load environment variables
-load_dotenv()
+# Settings from the .env file next to this script, overridden by the real environment
+# (read into a dict instead of being copied into os.environ; keys listed without a value, which
+# dotenv_values reads as None, are left out so they fall back to their defaults)
+ENV = {
+    **{
+        key: value
+        for key, value in dotenv_values(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env')).items()
+        if value is not None
+    },
+    **os.environ
+}
 
-def test_model_configuration():
-    """Test if the model is configured correctly"""
-    print("=" * 60)
-    print("TESTING AWS BEDROCK MODEL CONFIGURATION")
-    print("=" * 60)
+# boto3/botocore are imported on first client creation, so a disabled or unconfigured
+# run (which returns before creating any client) does not pay for importing them
+
+# Model catalog responses are reused for a day - the catalog changes on the order of weeks
+MODEL_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'invoice_automation_hub')
+MODEL_CACHE_TTL_SECONDS = 24 * 60 * 60
+
+# Geography prefixes of cross-region inference profile IDs (e.g. us.anthropic.claude-...)
+INFERENCE_PROFILE_PREFIXES = {'us', 'eu', 'apac', 'us-gov', 'global'}
+
+# Printed when the configuration test passes
+SUMMARY_TEMPLATE = (
+    "\n[SUCCESS] Model configuration test passed!\n"
+    "\nSummary:\n"
+    "   [OK] Model: {model}\n"
+    "   [OK] Region: {region}\n"
+    "   [OK] Client: Initialized\n"
+    "   [OK] Ready for invoice processing\n"
+)
+
+# boto3 Sessions are not thread-safe, so clients are created one at a time even from worker threads
+CLIENT_LOCK = threading.Lock()
+
+@lru_cache(maxsize=1)
+def get_client_config():
+    """Config shared by the bedrock and bedrock-runtime clients: keep-alive connections, and short
+    timeouts with one retry so a slow endpoint fails the test in seconds instead of minutes"""
+    import botocore.config
+    return botocore.config.Config(
+        tcp_keepalive=True,
+        max_pool_connections=20,
+        connect_timeout=5,
+        read_timeout=15,
+        retries={'max_attempts': 2, 'mode': 'standard'}
+    )
+
+@lru_cache(maxsize=4)
+def get_session(region, aws_access_key_id, aws_secret_access_key):
+    """boto3 Session per region/credentials - its clients share one credential chain and service-model cache"""
+    import boto3
+    return boto3.Session(
+        aws_access_key_id=aws_access_key_id,
+        aws_secret_access_key=aws_secret_access_key,
+        region_name=region
+    )
+
+@lru_cache(maxsize=8)
+def get_client(service, region, aws_access_key_id, aws_secret_access_key):
+    """boto3 client for a service, built once per service/region/credentials and then reused"""
+    with CLIENT_LOCK:
+        return get_session(region, aws_access_key_id, aws_secret_access_key).client(service, config=get_client_config())
+
+def list_foundation_model_ids(bedrock_client, **filters):
+    """Set of foundation model IDs across all pages (single response if the API has no paginator)"""
+    if bedrock_client.can_paginate('list_foundation_models'):
+        pages = bedrock_client.get_paginator('list_foundation_models').paginate(**filters)
+    else:
+        pages = [bedrock_client.list_foundation_models(**filters)]
+    model_ids = set()
+    for page in pages:
+        model_ids.update(m['modelId'] for m in page.get('modelSummaries', []))
+    return model_ids
+
+def list_inference_profile_ids(bedrock_client):
+    """Set of inference profile IDs across all pages"""
+    profile_ids = set()
+    for page in bedrock_client.get_paginator('list_inference_profiles').paginate():
+        profile_ids.update(p['inferenceProfileId'] for p in page.get('inferenceProfileSummaries', []))
+    return profile_ids
+
+def fetch_model_ids(provider, region, aws_access_key_id, aws_secret_access_key, inference_profiles=False):
+    """Foundation model IDs for a provider (filtered server-side); when the API rejects the
+    provider or knows no models for it, the whole catalog is listed instead.
+    inference_profiles: list the region's inference profile IDs instead (cross-region model IDs
+    such as us.anthropic... are not in the foundation model catalog).
+    Non-empty results are cached on disk per region/provider for MODEL_CACHE_TTL_SECONDS."""
+    if inference_profiles:
+        cache_path = os.path.join(MODEL_CACHE_DIR, f"bedrock-inference-profiles-{region}.json")
+    else:
+        cache_path = os.path.join(MODEL_CACHE_DIR, f"bedrock-models-{region}-{provider}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_path) < MODEL_CACHE_TTL_SECONDS:
+            with open(cache_path, 'r') as f:
+                return set(json.load(f))
+    except (OSError, ValueError):
+        pass
+    
+    from botocore.exceptions import ClientError, ParamValidationError
+    bedrock_client = get_client("bedrock", region, aws_access_key_id, aws_secret_access_key)
+    if inference_profiles:
+        model_ids = list_inference_profile_ids(bedrock_client)
+    else:
+        try:
+            model_ids = list_foundation_model_ids(bedrock_client, byProvider=provider)
+        except (ClientError, ParamValidationError):
+            model_ids = set()
+        # A model-ID prefix that is not a provider name the API knows comes back as an empty list
+        if not model_ids:
+            model_ids = list_foundation_model_ids(bedrock_client)
+    
+    if not model_ids:
+        return model_ids
+    
+    try:
+        os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+        with open(cache_path, 'w') as f:
+            json.dump(sorted(model_ids), f)
+    except OSError:
+        pass
+    return model_ids
+
+def model_provider(bedrock_model):
+    """(provider, is_inference_profile) for a model ID - cross-region IDs carry a geography prefix"""
+    prefix, _, rest = bedrock_model.partition('.')
+    if prefix in INFERENCE_PROFILE_PREFIXES:
+        return rest.split('.', 1)[0], True
+    return prefix, False
+
+@dataclass(frozen=True)
+class ConfigResult:
+    """Outcome of test_model_configuration
+    available_models: the catalog the model was checked against (empty when it was not listed)"""
+    ok: bool
+    model: str
+    region: str
+    available_models: frozenset = frozenset()
+
+def verify_models(models):
+    """Check several model IDs at once, listing each provider's catalog only once
+    Applies the same enabled/credential checks as test_model_configuration and
+    returns {model_id: ConfigResult}; ok is False when a model is not in its catalog."""
+    env = ENV
+    aws_access_key_id = env.get('AWS_ACCESS_KEY_ID')
+    aws_secret_access_key = env.get('AWS_SECRET_ACCESS_KEY')
+    aws_region = env.get('AWS_DEFAULT_REGION', 'us-east-1')
+    enabled = env.get('ENABLE_OPENAI_VISION', 'false').lower() == 'true'
+    
+    if not enabled or not aws_access_key_id or not aws_secret_access_key:
+        return {model: ConfigResult(False, model, aws_region) for model in models}
+    
+    catalogs = {}
+    results = {}
+    for model in models:
+        provider, is_inference_profile = model_provider(model)
+        if (provider, is_inference_profile) not in catalogs:
+            try:
+                catalogs[provider, is_inference_profile] = frozenset(fetch_model_ids(
+                    provider, aws_region, aws_access_key_id, aws_secret_access_key,
+                    inference_profiles=is_inference_profile
+                ))
+            except Exception:
+                # Catalog could not be listed (e.g. no bedrock:ListFoundationModels permission)
+                catalogs[provider, is_inference_profile] = frozenset()
+        model_ids = catalogs[provider, is_inference_profile]
+        results[model] = ConfigResult(model in model_ids, model, aws_region, model_ids)
+    return results
+
+def write_lines(*lines):
+    """Write a block of output lines with a single stdout write"""
+    sys.stdout.write("\n".join(lines) + "\n")
+
+def test_model_configuration(verify_model=False):
+    """Test if the model is configured correctly - returns a ConfigResult
+    verify_model: also check the model ID against the region's model catalog (one Bedrock API call)"""
+    write_lines("=" * 60, "TESTING AWS BEDROCK MODEL CONFIGURATION", "=" * 60)
     
     # Get model from environment or default
-    bedrock_model = os.getenv('AWS_BEDROCK_MODEL', 'deepseek.deepseek-r1-70b-v1:0')
-    aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-    aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-    aws_region = os.getenv('AWS_DEFAULT_REGION', 'us-east-1')
-    enabled = os.getenv('ENABLE_OPENAI_VISION', 'false').lower() == 'true'
+    env = ENV
+    bedrock_model = env.get('AWS_BEDROCK_MODEL', 'deepseek.deepseek-r1-70b-v1:0')
+    aws_access_key_id = env.get('AWS_ACCESS_KEY_ID')
+    aws_secret_access_key = env.get('AWS_SECRET_ACCESS_KEY')
+    aws_region = env.get('AWS_DEFAULT_REGION', 'us-east-1')
+    enabled = env.get('ENABLE_OPENAI_VISION', 'false').lower() == 'true'
     
-    print(f"\nConfiguration:")
-    print(f"   Model: {bedrock_model}")
-    print(f"   Region: {aws_region}")
-    print(f"   Enabled: {enabled}")
-    print(f"   AWS Access Key: {'[OK] Set' if aws_access_key_id else '[MISSING] Not set'}")
-    print(f"   AWS Secret Key: {'[OK] Set' if aws_secret_access_key else '[MISSING] Not set'}")
+    write_lines(
+        "\nConfiguration:",
+        f"   Model: {bedrock_model}",
+        f"   Region: {aws_region}",
+        f"   Enabled: {enabled}",
+        f"   AWS Access Key: {'[OK] Set' if aws_access_key_id else '[MISSING] Not set'}",
+        f"   AWS Secret Key: {'[OK] Set' if aws_secret_access_key else '[MISSING] Not set'}"
+    )
     
     if not enabled:
-        print("\n[WARNING] Model is disabled in environment")
-        print("   Set ENABLE_OPENAI_VISION=true in .env file")
-        return False
+        write_lines("\n[WARNING] Model is disabled in environment", "   Set ENABLE_OPENAI_VISION=true in .env file")
+        return ConfigResult(False, bedrock_model, aws_region)
     
     if not aws_access_key_id or not aws_secret_access_key:
-        print("\n[WARNING] AWS credentials not configured")
-        print("   Set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in .env file")
-        return False
+        write_lines("\n[WARNING] AWS credentials not configured", "   Set AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY in .env file")
+        return ConfigResult(False, bedrock_model, aws_region)
     
     # Try to initialize boto3 client
     try:
-        print("\nInitializing AWS Bedrock client...")
-        client = boto3.client(
-            "bedrock-runtime",
-            aws_access_key_id=aws_access_key_id,
-            aws_secret_access_key=aws_secret_access_key,
-            region_name=aws_region
-        )
-        print("[SUCCESS] AWS Bedrock client initialized successfully!")
-        
-        # Test model availability (simple test)
-        print(f"\nTesting model availability: {bedrock_model}")
-        print("   (This will check if the model ID is valid)")
-        
-        # Try to list available models (if possible)
-        try:
-            bedrock_client = boto3.client(
-                "bedrock",
-                aws_access_key_id=aws_access_key_id,
-                aws_secret_access_key=aws_secret_access_key,
-                region_name=aws_region
-            )
-            models = bedrock_client.list_foundation_models()
+        write_lines("\nInitializing AWS Bedrock client...")
+        provider, is_inference_profile = model_provider(bedrock_model)
+        model_ids = frozenset()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # The model catalog is only listed on request (--verify-model); that request
+            # then runs while the runtime client is being built
+            catalog_future = None
+            if verify_model:
+                catalog_future = executor.submit(
+                    fetch_model_ids, provider, aws_region, aws_access_key_id, aws_secret_access_key,
+                    inference_profiles=is_inference_profile
+                )
+            client = get_client("bedrock-runtime", aws_region, aws_access_key_id, aws_secret_access_key)
+            write_lines("[SUCCESS] AWS Bedrock client initialized successfully!")
             
-            # Check if our model is in the list
-            model_ids = [m['modelId'] for m in models.get('modelSummaries', [])]
-            if bedrock_model in model_ids:
-                print(f"   [OK] Model '{bedrock_model}' is available in your region!")
+            if catalog_future is None:
+                write_lines("   (Model availability not checked - run with --verify-model to check it)")
             else:
-                print(f"   [WARNING] Model '{bedrock_model}' not found in available models")
-                print(f"   Available models in region '{aws_region}':")
-                for model_id in model_ids[:10]:  # Show first 10
-                    if 'claude' in model_id.lower() or bedrock_model.split('.')[0] in model_id:
-                        print(f"      - {model_id}")
-        except Exception as e:
-            print(f"   [WARNING] Could not verify model availability: {e}")
-            print(f"   (This is okay - model might still work)")
+                write_lines(
+                    f"\nTesting model availability: {bedrock_model}",
+                    "   (This will check if the model ID is valid)"
+                )
+                
+                # Check if our model is in the list (if it could be listed)
+                try:
+                    model_ids = frozenset(catalog_future.result())
+                    if bedrock_model in model_ids:
+                        write_lines(f"   [OK] Model '{bedrock_model}' is available in your region!")
+                    else:
+                        # Show the first 10 matches - kept in a bounded heap instead of sorting every ID
+                        matching_pattern = re.compile(rf"claude|{re.escape(provider)}", re.IGNORECASE)
+                        matching_ids = (model_id for model_id in model_ids if matching_pattern.search(model_id))
+                        write_lines(
+                            f"   [WARNING] Model '{bedrock_model}' not found in available models",
+                            f"   Available models in region '{aws_region}':",
+                            *(f"      - {model_id}" for model_id in heapq.nsmallest(10, matching_ids))
+                        )
+                except Exception as e:
+                    write_lines(
+                        f"   [WARNING] Could not verify model availability: {e}",
+                        "   (This is okay - model might still work)"
+                    )
         
-        print(f"\n[SUCCESS] Model configuration test passed!")
-        print(f"\nSummary:")
-        print(f"   [OK] Model: {bedrock_model}")
-        print(f"   [OK] Region: {aws_region}")
-        print(f"   [OK] Client: Initialized")
-        print(f"   [OK] Ready for invoice processing")
+        sys.stdout.write(SUMMARY_TEMPLATE.format_map({'model': bedrock_model, 'region': aws_region}))
         
-        return True
+        return ConfigResult(True, bedrock_model, aws_region, model_ids)
         
     except Exception as e:
-        print(f"\n[ERROR] Error initializing AWS Bedrock client: {e}")
-        print(f"   Check your AWS credentials and region settings")
-        return False
+        write_lines(
+            f"\n[ERROR] Error initializing AWS Bedrock client: {e}",
+            "   Check your AWS credentials and region settings"
+        )
+        return ConfigResult(False, bedrock_model, aws_region)
 
 def main():
     """Run test"""
-    print("\n" + "AWS BEDROCK MODEL CONFIGURATION TEST")
-    print("=" * 60)
+    import argparse
+    parser = argparse.ArgumentParser(description="Verify the AWS Bedrock model configuration")
+    parser.add_argument('--verify-model', action='store_true',
+                        help="also check that the model ID is listed in the region's model catalog")
+    parser.add_argument('--models', nargs='+', metavar='MODEL_ID',
+                        help="only check these model IDs against the region's model catalog")
+    args = parser.parse_args()
     
-    result = test_model_configuration()
+    write_lines("\n" + "AWS BEDROCK MODEL CONFIGURATION TEST", "=" * 60)
     
-    print("\n" + "=" * 60)
-    if result:
-        print("[SUCCESS] Model configuration is correct!")
-        print("\nNext steps:")
-        print("   1. The model has been changed to: Claude Sonnet")
-        print("   2. Run your invoice processor to test it")
-        print("   3. Claude Sonnet provides better accuracy than Haiku")
+    if args.models:
+        results = verify_models(args.models)
+        write_lines(*(
+            f"   {'[OK]' if result.ok else '[MISSING]'} {model} ({result.region})"
+            + ("" if result.available_models else " - catalog not listed, check ENABLE_OPENAI_VISION and AWS credentials")
+            for model, result in results.items()
+        ))
+        return
+    
+    result = test_model_configuration(verify_model=args.verify_model)
+    
+    if result.ok:
+        write_lines(
+            "\n" + "=" * 60,
+            "[SUCCESS] Model configuration is correct!",
+            "\nNext steps:",
+            "   1. The model has been changed to: Claude Sonnet",
+            "   2. Run your invoice processor to test it",
+            "   3. Claude Sonnet provides better accuracy than Haiku",
+            "=" * 60
+        )
     else:
-        print("[WARNING] Model configuration needs attention")
-        print("\nCheck:")
-        print("   1. .env file has correct AWS credentials")
-        print("   2. ENABLE_OPENAI_VISION=true is set")
-        print("   3. AWS credentials have Bedrock access")
-    print("=" * 60)
+        write_lines(
+            "\n" + "=" * 60,
+            "[WARNING] Model configuration needs attention",
+            "\nCheck:",
+            "   1. .env file has correct AWS credentials",
+            "   2. ENABLE_OPENAI_VISION=true is set",
+            "   3. AWS credentials have Bedrock access",
+            "=" * 60
+        )
 
 if __name__ == "__main__":
     main()